@@ -5,10 +5,34 @@
 
 import xml.etree.ElementTree as ET
 import datetime
-import urllib2
+import time
+import copy
+import collections
+import hashlib
+import urlparse
+import os
+import urllib
+import Queue
+import bisect
+import functools
+import httplib
+import socket
+import errno
 import json
 import re
 import cgi
+import sys
+import array
+import itertools
+import unicodedata
+
+# The profiler (see Profiling) is optional - Plex may not let us have it:
+try:
+	import cProfile
+	import pstats
+	import marshal
+except ImportError:
+	cProfile = None
 
 def L2(key):
 	result = str(L(key))
@@ -20,10 +44,19 @@ def F2(key, *args):
 ####################################################################################################
 NAME = "PLUGIN_TITLE"
 PVR_URL = 'http://%s:%s/' % (Prefs['server'],Prefs['port'])
+BACKEND_URLS = [PVR_URL]	# PVR_URL, followed by the otherBackends (see "Recordings cache")
 CACHE_TIME = 120
 
 USE_DATA_CACHE = True
 DATA_CACHE_TIME = 120
+BACKGROUND_REFRESH = True
+MAX_STALE_TIME = 900
+INCREMENTAL_SYNC = True
+FULL_RELOAD_TIME = 3600
+
+USE_ARTWORK_CACHE = True
+ARTWORK_CACHE_SIZE = 200 * 1024 * 1024
+PREFETCH_ARTWORK = True
 
 MAX_EPISODES_PER_PAGE = 20
 DETECT_SERIES_BY_TITLE = True
@@ -131,8 +164,7 @@ def GetReadableKeyName(keyname):
 # 	   "^CSI: New York"
 #    ]
 
-TITLE_SPLITTERS = json.loads(Resource.Load("TitleSplitters.json"))
-TITLE_NOSPLITTERS = json.loads(Resource.Load("TitleSplitExemptions.json")) # Regular expression matching
+# (loaded as part of the title rules - see "Title rules" below)
 
 # Category aliases
 # ================
@@ -140,7 +172,7 @@ TITLE_NOSPLITTERS = json.loads(Resource.Load("TitleSplitExemptions.json")) # Reg
 # often the category values deoend on the channel the recording was made from.
 # 
 # To avoid having the category list filled up with categories that only vary in spelling
-# or language, the CategoryAliases list-of-lists below is used.
+# or language, the CategoryAliases list-of-lists below (CategoryAliases.json) is used.
 # 
 # CategoryAliases is a list of alias lists. Each alias list consists of the canonical 
 # name, followed by aliases.
@@ -159,7 +191,361 @@ TITLE_NOSPLITTERS = json.loads(Resource.Load("TitleSplitExemptions.json")) # Reg
 # 		["UNCATEGORIZED", "Uncategorized", "", "Ukategoriseret"]
 # 	]
 
-CategoryAliases = json.loads(Resource.Load("CategoryAliases.json"))
+####################################################################################################
+# Title rules:
+# ============
+# The title splitters, split exemptions and category aliases above are compiled into TITLE_RULES:
+# the exemptions into a single regular expression, and the aliases into an {alias : canonical
+# name} dictionary.
+#
+# Every RULES_CHECK_INTERVAL seconds (when a route is called - see @instrumented), the resource
+# files are checked for changes. When they have changed, the rules are compiled anew, and the
+# titles, subtitles and categories of the recordings in the index are derived from the values
+# fetched from the backend again (see RederiveRecordingIndex) - without fetching anything. Rules
+# that don't compile (bad JSON or a bad regular expression) are logged, and ignored.
+####################################################################################################
+
+RULES_FILES = ["TitleSplitters.json", "TitleSplitExemptions.json", "CategoryAliases.json"]
+RULES_CHECK_INTERVAL = 10	# seconds
+
+RULES_LOCK = Thread.Lock()
+RULES_CHECKED = time.time()
+
+class TitleRules(object):
+	__slots__ = ('splitters', 'exemptions', 'categoryAliases')
+
+	def __init__(self, splitters, exemptions, categoryAliases):
+		self.splitters = list(splitters)
+
+		# Matching any title that one of the exemptions matches (None: no exemptions):
+		self.exemptions = None
+		if len(exemptions) > 0:
+			self.exemptions = re.compile("|".join("(?:%s)" % exemption for exemption in exemptions))
+
+		# (an alias appearing in more than one list maps to the name of the last one)
+		self.categoryAliases = {}
+		for aliasList in categoryAliases:
+			for alias in aliasList:
+				self.categoryAliases[alias] = aliasList[0]
+
+def ReadRulesFiles():
+	return [Resource.Load(name) for name in RULES_FILES]
+
+def RulesDigest(contents):
+	return hashlib.sha1("\0".join(contents)).hexdigest()
+
+def CompileTitleRules(contents):
+	splitters, exemptions, categoryAliases = [json.loads(content) for content in contents]
+	return TitleRules(splitters, exemptions, categoryAliases)
+
+RULES_CONTENTS = ReadRulesFiles()
+TITLE_RULES = CompileTitleRules(RULES_CONTENTS)
+RULES_DIGEST = RulesDigest(RULES_CONTENTS)		# of the files last compiled (successfully or not)
+del RULES_CONTENTS
+
+# Recompiles the rules if the resource files have changed:
+def CheckTitleRules():
+	global RULES_CHECKED, RULES_DIGEST, TITLE_RULES
+
+	RULES_LOCK.acquire()
+	try:
+		if time.time() - RULES_CHECKED < RULES_CHECK_INTERVAL:
+			return # another thread got here first
+		RULES_CHECKED = time.time()
+
+		try:
+			contents = ReadRulesFiles()
+			digest = RulesDigest(contents)
+			if digest == RULES_DIGEST:
+				return
+			RULES_DIGEST = digest
+			rules = CompileTitleRules(contents)
+		except Exception, e:
+			Log("CheckTitleRules: ignoring the changed rules: %s" % e)
+			return
+
+		Log("CheckTitleRules: the rules have changed")
+		TITLE_RULES = rules
+	finally:
+		RULES_LOCK.release()
+
+	RederiveRecordingIndex()
+
+####################################################################################################
+# Statistics:
+# ===========
+# To find out where the time goes when browsing is slow, the plugin keeps
+#    - timing histograms for each route (see @instrumented) and for the main phases of loading
+#      the recordings (fetching and parsing the recorded list, building the recording index,
+#      loading and saving the recording snapshot, rendering a recording)
+#    - counters of cache hits, misses and stale hits (recording index, snapshot, sorted views,
+#      artwork)
+#    - backend request counts, latency and bytes (see BACKEND_STATS)
+#    - the size of the recording index and the artwork cache
+#
+# The statistics are served (as JSON) by the Stats route, and written to the STATS_FILE data
+# item every STATS_DUMP_INTERVAL seconds.
+####################################################################################################
+
+STATS_FILE = "Stats.json"
+STATS_DUMP_INTERVAL = 60
+STATS_STARTED = time.time()
+
+# The upper bounds (seconds) of the histogram buckets - the last bucket holds the rest:
+HISTOGRAM_BOUNDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10]
+
+STATS_LOCK = Thread.Lock()
+ROUTE_TIMINGS = {}		# {route name : Histogram}
+PHASE_TIMINGS = {}		# {phase name : Histogram}
+CACHE_COUNTERS = {}		# {counter name : count}
+STATS_DUMPED = time.time()
+
+class Histogram(object):
+	__slots__ = ('count', 'totalTime', 'maxTime', 'buckets')
+
+	def __init__(self):
+		self.count = 0
+		self.totalTime = 0.0
+		self.maxTime = 0.0
+		self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+	def Add(self, seconds):
+		self.count = self.count + 1
+		self.totalTime = self.totalTime + seconds
+		self.maxTime = max(self.maxTime, seconds)
+		self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+
+	# The buckets are listed in the order of HISTOGRAM_BOUNDS (see GetStats):
+	def AsDict(self):
+		return {
+			"count": self.count,
+			"totalMs": round(self.totalTime * 1000, 3),
+			"maxMs": round(self.maxTime * 1000, 3),
+			"buckets": list(self.buckets)
+		}
+
+def RecordTiming(timings, name, seconds):
+	STATS_LOCK.acquire()
+	try:
+		histogram = timings.get(name)
+		if histogram is None:
+			histogram = timings[name] = Histogram()
+		histogram.Add(seconds)
+	finally:
+		STATS_LOCK.release()
+
+def CountCacheEvent(name):
+	STATS_LOCK.acquire()
+	try:
+		CACHE_COUNTERS[name] = CACHE_COUNTERS.get(name, 0) + 1
+	finally:
+		STATS_LOCK.release()
+
+# Decorator timing (and maybe profiling - see Profiling) a route - put it below @route/@handler:
+def instrumented(function):
+	@functools.wraps(function)
+	def InstrumentedRoute(*args, **kwargs):
+		if time.time() - RULES_CHECKED > RULES_CHECK_INTERVAL:
+			CheckTitleRules()
+		profiler, sampled = StartProfiling()
+		startTime = time.time()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			elapsed = time.time() - startTime
+			if not profiler is None:
+				profiler.disable()
+				if sampled or (PROFILE_SLOWER_THAN and elapsed > PROFILE_SLOWER_THAN):
+					SaveProfile(profiler, function.__name__, args, kwargs, elapsed)
+			RecordTiming(ROUTE_TIMINGS, function.__name__, elapsed)
+			if time.time() - STATS_DUMPED > STATS_DUMP_INTERVAL:
+				DumpStats()
+	return InstrumentedRoute
+
+def GetStats():
+	STATS_LOCK.acquire()
+	try:
+		stats = {
+			"timestamp": datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+			"uptime": round(time.time() - STATS_STARTED),
+			"bucketBoundsMs": [bound * 1000 for bound in HISTOGRAM_BOUNDS] + [None],
+			"routes": dict((name, histogram.AsDict()) for name, histogram in ROUTE_TIMINGS.items()),
+			"phases": dict((name, histogram.AsDict()) for name, histogram in PHASE_TIMINGS.items()),
+			"cache": dict(CACHE_COUNTERS)
+		}
+	finally:
+		STATS_LOCK.release()
+
+	BACKEND_LOCK.acquire()
+	try:
+		stats["backend"] = dict((endpoint, {
+				"requests": backendStats.requests,
+				"failures": backendStats.failures,
+				"totalMs": round(backendStats.totalTime * 1000, 3),
+				"maxMs": round(backendStats.maxTime * 1000, 3),
+				"bytes": backendStats.bytes
+			}) for endpoint, backendStats in BACKEND_STATS.items())
+	finally:
+		BACKEND_LOCK.release()
+
+	index = RECORDING_INDEX
+	if index is None:
+		stats["index"] = None
+	else:
+		stats["index"] = {
+			"entries": len(index.entries),
+			"recordings": len(index.recordings),
+			"views": len(index.views),
+			"series": len(index.series),
+			"ageSeconds": AgeInSeconds(index.timestamp),
+			"fullAgeSeconds": AgeInSeconds(index.fullTimestamp),
+			"backends": [{
+					"url": source.url,
+					"entries": len(source.entries),
+					"ageSeconds": AgeInSeconds(source.timestamp),
+					"fullAgeSeconds": AgeInSeconds(source.fullTimestamp),
+					"error": source.error
+				} for source in index.sources]
+		}
+	stats["viewRegistry"] = len(VIEW_REGISTRY or [])
+	stats["artworkCache"] = {
+		"entries": len(ARTWORK_ENTRIES or []),
+		"bytes": ARTWORK_BYTES,
+		"missing": len(ARTWORK_MISSING)
+	}
+	return stats
+
+def AgeInSeconds(timestamp):
+	if timestamp is None:
+		return None
+	return round((datetime.datetime.now() - timestamp).total_seconds())
+
+def DumpStats():
+	global STATS_DUMPED
+	STATS_DUMPED = time.time()
+	try:
+		Data.Save(STATS_FILE, json.dumps(GetStats(), indent = 1, sort_keys = True))
+	except Exception, e:
+		Log("DumpStats: could not save statistics: %s" % e)
+
+@route('/video/mythrecordings/Stats')
+def Stats():
+	DumpStats()
+	return DataObject(json.dumps(GetStats(), indent = 1, sort_keys = True), 'application/json')
+
+####################################################################################################
+# Profiling:
+# ==========
+# The statistics tell which routes are slow, but not which code. For that, the routes can be
+# profiled with cProfile (see @instrumented):
+#    - one request in PROFILE_EVERY (pref profileEvery, 0 for none), and/or
+#    - requests slower than PROFILE_SLOWER_THAN (pref profileSlowerThan, 0 for none). As we
+#      can't know in advance which requests will be slow, this profiles every request (which
+#      makes them slower), keeping only the profiles of the slow ones.
+#
+# The profiles are saved as data items Profile-NN.pstats (the format written by
+# pstats.Stats.dump_stats - load them with pstats.Stats(filename)), using the PROFILE_FILES
+# names in rotation. PROFILE_INDEX_FILE lists the route, arguments (filterBy, groupByList,
+# startWith...), duration and time of each saved profile - so the profiles can be matched to
+# the navigation that was slow. Both are served by the Profiles and Profile routes too.
+#
+# Requests calling another route (like GroupRecordingsBy calling GetRecordingList) are
+# profiled as one.
+####################################################################################################
+
+PROFILE_EVERY = 0
+PROFILE_SLOWER_THAN = 0		# seconds
+PROFILE_FILES = 20
+PROFILE_INDEX_FILE = "Profiles.json"
+
+PROFILE_REQUESTS = 0		# requests since the last sampled one
+PROFILE_INDEX = None		# {"next": next file number, "profiles": {file name : profile info}}
+
+# Returns (profiler, sampled): the (running) profiler for this request, or None - and whether
+# the request was sampled (to be saved whatever its duration):
+def StartProfiling():
+	global PROFILE_REQUESTS
+	if cProfile is None or (not PROFILE_EVERY and not PROFILE_SLOWER_THAN):
+		return None, False
+
+	# Already profiling this thread (a route calling a route)?
+	if not sys.getprofile() is None:
+		return None, False
+
+	sampled = False
+	if PROFILE_EVERY:
+		STATS_LOCK.acquire()
+		try:
+			PROFILE_REQUESTS = PROFILE_REQUESTS + 1
+			if PROFILE_REQUESTS >= PROFILE_EVERY:
+				PROFILE_REQUESTS = 0
+				sampled = True
+		finally:
+			STATS_LOCK.release()
+
+	if not sampled and not PROFILE_SLOWER_THAN:
+		return None, False
+
+	profiler = cProfile.Profile()
+	profiler.enable()
+	return profiler, sampled
+
+def SaveProfile(profiler, routeName, args, kwargs, elapsed):
+	global PROFILE_INDEX
+	try:
+		data = marshal.dumps(pstats.Stats(profiler).stats)
+		info = {
+			"route": routeName,
+			"args": args,
+			"kwargs": kwargs,
+			"elapsedMs": round(elapsed * 1000, 3),
+			"timestamp": datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+		}
+
+		STATS_LOCK.acquire()
+		try:
+			if PROFILE_INDEX is None:
+				PROFILE_INDEX = LoadProfileIndex()
+			number = PROFILE_INDEX["next"] % PROFILE_FILES
+			PROFILE_INDEX["next"] = number + 1
+			name = "Profile-%02d.pstats" % number
+			info["file"] = name
+			PROFILE_INDEX["profiles"][name] = info
+
+			Data.Save(name, data)
+			Data.Save(PROFILE_INDEX_FILE, json.dumps(PROFILE_INDEX, indent = 1, sort_keys = True, default = repr))
+		finally:
+			STATS_LOCK.release()
+		Log("SaveProfile: %s took %.0f ms - profile saved as %s" % (routeName, elapsed * 1000, name))
+	except Exception, e:
+		Log("SaveProfile: could not save the profile of %s: %s" % (routeName, e))
+
+def LoadProfileIndex():
+	try:
+		if Data.Exists(PROFILE_INDEX_FILE):
+			index = json.loads(Data.Load(PROFILE_INDEX_FILE))
+			if "next" in index and "profiles" in index:
+				return index
+	except Exception, e:
+		Log("LoadProfileIndex: ignoring %s: %s" % (PROFILE_INDEX_FILE, e))
+	return {"next": 0, "profiles": {}}
+
+# Lists the saved profiles, most recent first:
+@route('/video/mythrecordings/Profiles')
+def Profiles():
+	STATS_LOCK.acquire()
+	try:
+		index = PROFILE_INDEX or LoadProfileIndex()
+		profiles = sorted(index["profiles"].values(), key = lambda info: info["timestamp"], reverse = True)
+	finally:
+		STATS_LOCK.release()
+	return DataObject(json.dumps(profiles, indent = 1, sort_keys = True, default = repr), 'application/json')
+
+@route('/video/mythrecordings/Profile')
+def Profile(name):
+	if not re.match(r'^Profile-\d+\.pstats$', name) or not Data.Exists(name):
+		return MessageContainer("Error", "No profile named %s" % name)
+	return DataObject(Data.Load(name), 'application/octet-stream')
 
 ####################################################################################################
 
@@ -168,7 +554,10 @@ def Start():
 
 	Log('%s Started' % L2(NAME))
 	ValidatePrefs()
-	Log('Base URL set to %s' % PVR_URL)
+	Log('Base URL set to %s' % ", ".join(BACKEND_URLS))
+
+	if USE_DATA_CACHE:
+		LoadCachedRecordingIndex()
 
 ####################################################################################################
 # MainMenu:
@@ -179,6 +568,7 @@ def Start():
 #    ObjectContainer
 ####################################################################################################
 @handler('/video/mythrecordings','MythTV recordings')
+@instrumented
 def MainMenu():
     dir=ObjectContainer(art = R(MYTHTV_BACKGROUND))
 
@@ -229,6 +619,15 @@ def MainMenu():
         )
     )
 
+    # Search:
+    dir.add(
+        InputDirectoryObject(
+            key=Callback(Search), 
+            title=L2('SEARCH'), 
+            prompt=L2('SEARCH_PROMPT')
+        )
+    )
+
     # Preferences:
     dir.add(
         PrefsObject(
@@ -288,6 +687,7 @@ def MainMenu():
 #
 ####################################################################################################
 @route('/video/mythrecordings/GroupRecordingsBy', filterBy = dict, startWith = int, groupByList = list) 
+@instrumented
 def GroupRecordingsBy(groupByList = [], filterBy = {}, startWith = 0, seriesInetRef = None, staticBackground = None):
 	Log("GroupRecordingsBy(groupByList = %s, filterBy = %s, seriesInetRef = %s, staticBackground = %s)" % (groupByList, filterBy, seriesInetRef, staticBackground))
 	if groupByList is None:
@@ -318,32 +718,26 @@ def GroupRecordingsBy(groupByList = [], filterBy = {}, startWith = 0, seriesInet
 
 	oc = ObjectContainer(title2=title, art=backgroundUrl) # title1 is not displayed (on most clients, anyway)
 	
-	# Get the recordings metadata from the MythTV backend:
-	recordings = GetMythTVRecordings(filterBy)
-	
-	# Sort the recordings into a {string : recording[]} dictionary
-	entries = {}
-	for recording in recordings:
-		keyValue = GetField(recording, groupByKey)
-		if keyValue is None:
-			keyValue = ""
-		keyValue = keyValue.strip(" \t!?")
+	# Get the recordings metadata from the MythTV backend, already sorted into
+	# groups (see "Group trees" below):
+	index = GetRecordingIndexFor(filterBy)
+	node = index.GroupTree(filterBy, groupByList)
 
-		if not entries.has_key(keyValue):
-			entries[keyValue] = []
-		entries[keyValue].append(recording)
+	# The entries are already in order - so a page is just a slice of them:
+	start = int(startWith)
+	end = len(node.entries)
+	if USE_PAGING:
+		end = min(end, start + MAX_EPISODES_PER_PAGE)
 
 	# Loop through the keys and create a subdirectory entry for each:
-	theresMore = False
-	subdirList = entries.keys()
-	subdirList.sort()
-	for subdirName in subdirList[startWith:]:
+	for entry in node.entries[start:end]:
+		subdirName = entry.name
+
 		# make sure that only the matching recordings appear in the subdir:
                 subdirFilterBy = filterBy.copy()
                 subdirFilterBy[groupByKey] = subdirName
 
-		subdirContents = entries[subdirName]
-		entryTitle = "%s (%s)" % (L2(subdirName), len(subdirContents))
+		entryTitle = "%s (%s)" % (L2(subdirName), entry.node.count)
 		
 		# Icon and background image for the subdir:
 		subSeriesInetRef = None
@@ -358,7 +752,7 @@ def GroupRecordingsBy(groupByList = [], filterBy = {}, startWith = 0, seriesInet
 			else:
 				# Experimental: we're assuming that recordings with the same
 				# name are episode of a series.
-				subSeriesInetRef = GetInetref(subdirContents)
+				subSeriesInetRef = entry.node.inetref
 				subdirIconUrl = GetSeriesIcon(subSeriesInetRef, UNKNOWN_SERIES_ICON)
 				subdirStaticBackground = UNKNOWN_SERIES_BACKGROUND
 		else:
@@ -368,21 +762,21 @@ def GroupRecordingsBy(groupByList = [], filterBy = {}, startWith = 0, seriesInet
 			subdirStaticBackground = '%sBackground_%s.png' % (CamelCase(GetReadableKeyName(groupByKey)), CamelCase(subdirName))
 
 		# Create the subdir:
-		if len(subdirContents) == 1 and groupByKey == "Title": 
+		if not entry.recordingId is None:
                         # Experimental:
                         # =============
                         # If the subdirectory we're about to create only contains a
                         # single entry, we'll save the extra level and just put the
-                        # recording in.
-			recording = subdirContents[0]
+                        # recording in (see GroupEntry).
+			recording = index.Lookup(entry.recordingId)
 			oc.add(Recording(recording, seriesInetRef=subSeriesInetRef))
 		else:
                         # Otherwise, we'll play it straight and recurse the next level down
 			oc.add(
                             DirectoryObject(
                                 key=
-				    Callback(
-                                        GroupRecordingsBy,
+				    ViewCallback(
+                                        "GroupRecordingsBy",
                                         filterBy=subdirFilterBy,
                                         groupByList=subdirGroupByList,
                                         seriesInetRef=subSeriesInetRef,
@@ -393,24 +787,19 @@ def GroupRecordingsBy(groupByList = [], filterBy = {}, startWith = 0, seriesInet
                             )
                         )
 
-		# Break if the page-lenght is exceeded
-		if USE_PAGING and len(oc) >= MAX_EPISODES_PER_PAGE:
-			theresMore = True # remember to put in next-page entry when we're done
-			break
+	# Put in the next-page entry:
+	if end < len(node.entries):
+		# Warm the artwork of the next page (see "Artwork prefetch" below):
+		PrefetchGroupArtwork(index, groupByKey, node.entries[end:end + MAX_EPISODES_PER_PAGE])
 
-	# OK, now we sort the list:
-	oc.objects.sort(key=lambda obj: obj.title)
-	
-	# ...and put in the next-page entry AFTER the sort:
-	if theresMore:
 		oc.add(
 			NextPageObject(
 				key = 
-					Callback(
-						GroupRecordingsBy,
+					ViewCallback(
+						"GroupRecordingsBy",
 						groupByList = groupByList,
 						filterBy = filterBy,
-						startWith = int(startWith) + len(oc),
+						startWith = end,
 						seriesInetRef = seriesInetRef,
 						staticBackground = staticBackground
 					),
@@ -425,24 +814,419 @@ def GroupRecordingsBy(groupByList = [], filterBy = {}, startWith = 0, seriesInet
 # Get metadata about a series, as recorded by MythTV
 ####################################################################################################
 
-def GetInetref(recordings):
-	for recording in recordings:
-		val = GetField(recording, 'Inetref')
-		if not val is None:
-			return val
-	return None
-
 def GetSeriesIcon(inetref, staticBackground = UNKNOWN_SERIES_ICON):
-	url = "%sContent/GetRecordingArtwork?Inetref=%s&Type=fanart" % (PVR_URL, inetref)
-	if SCREENSHOT_ICON_HEIGHT:
-		url = url + "&Height=%s" % SCREENSHOT_ICON_HEIGHT
-	if SCREENSHOT_ICON_WIDTH:
-		url = url + "&Width=%s" % SCREENSHOT_ICON_WIDTH
-	return Resource.ContentsOfURLWithFallback(url = url, fallback = staticBackground)
+	return GetArtwork('fanart', inetref, SCREENSHOT_ICON_WIDTH, SCREENSHOT_ICON_HEIGHT, staticBackground)
 
 def GetSeriesBackground(inetref, staticBackground = UNKNOWN_SERIES_BACKGROUND):
-	url = "%sContent/GetRecordingArtwork?Inetref=%s&Type=fanart" % (PVR_URL, inetref)
-	return Resource.ContentsOfURLWithFallback(url = url, fallback = staticBackground)
+	return GetArtwork('fanart', inetref, None, None, staticBackground)
+
+def GetPreviewImage(recording, staticBackground = UNKNOWN_SERIES_BACKGROUND):
+	if not USE_ARTWORK_CACHE:
+		return Resource.ContentsOfURLWithFallback(url = recording.previewUrl, fallback = staticBackground)
+	return GetArtwork('preview', recording.id, SCREENSHOT_ICON_WIDTH, SCREENSHOT_ICON_HEIGHT, staticBackground)
+
+####################################################################################################
+# Artwork cache:
+# ==============
+# Series fanart and recording preview images come from the MythTV backend - which has to
+# (re)generate resized images every time a client asks for them.
+#
+# With USE_ARTWORK_CACHE set, the artwork is instead served by the Artwork route below, which
+# keeps the images it gets from the backend in the Plex data store. When the stored images take
+# up more than ARTWORK_CACHE_SIZE bytes, the least recently used ones are thrown away.
+#
+# Artwork that the backend doesn't have is remembered as missing too (for ARTWORK_MISSING_TIME
+# seconds, and at most ARTWORK_MISSING_SIZE keys), so we don't keep asking for it.
+#
+# The index of the stored images (ARTWORK_ENTRIES) is saved in the background, ARTWORK_SAVE_DELAY
+# seconds after the first change - pickling it takes a while for a large cache, and the pages
+# being rendered meanwhile need ARTWORK_LOCK.
+#
+# Artwork is identified by a key made from the kind of artwork ('fanart' or 'preview'), the
+# inetref (fanart) or recording ID (preview), and the size - see ArtworkKey.
+####################################################################################################
+
+ARTWORK_INDEX_KEY = "dk.schaumburg-it.plexapp.mythrecordings.ArtworkIndex"
+ARTWORK_MISSING_TIME = 3600
+ARTWORK_MISSING_SIZE = 10000
+ARTWORK_SAVE_DELAY = 10
+
+ARTWORK_LOCK = Thread.Lock()
+ARTWORK_ENTRIES = None		# {artwork key : size} OrderedDict, least recently used first
+ARTWORK_BYTES = 0			# total size of ARTWORK_ENTRIES
+ARTWORK_MISSING = collections.OrderedDict()	# {artwork key : time when we may ask the backend again}, soonest first
+ARTWORK_FLIGHTS = {}		# {artwork key : Event set when the fetch in flight completes}
+ARTWORK_SAVE_PENDING = False	# whether a save of ARTWORK_ENTRIES has been scheduled
+ARTWORK_SAVE_LOCK = Thread.Lock()	# held while saving
+
+# Returns the thumb/art value for a piece of artwork (None if there is none):
+def GetArtwork(kind, id, width, height, staticBackground):
+	if id is None:
+		if staticBackground is None:
+			return None
+		return R(staticBackground)
+
+	if not USE_ARTWORK_CACHE:
+		return Resource.ContentsOfURLWithFallback(url = BackendArtworkUrl(kind, id, width, height), fallback = staticBackground)
+
+	# Only pass the arguments we've got:
+	args = {'kind': kind, 'id': id}
+	if width:
+		args['width'] = str(width)
+	if height:
+		args['height'] = str(height)
+	if staticBackground:
+		args['fallback'] = staticBackground
+
+	# The client will ask for it shortly - get a head start:
+	PrefetchArtwork(kind, id, width, height)
+
+	return Callback(Artwork, **args)
+
+@route('/video/mythrecordings/Artwork')
+@instrumented
+def Artwork(kind, id, width = None, height = None, fallback = None):
+	key = ArtworkKey(kind, id, width, height)
+
+	data = LoadCachedArtwork(key)
+	if not data is None:
+		CountCacheEvent("artwork hit")
+	elif IsMissingArtwork(key):
+		CountCacheEvent("artwork missing")
+	else:
+		CountCacheEvent("artwork miss")
+		try:
+			data = FetchCachedArtwork(kind, id, width, height)
+		except Exception, e:
+			Log("Artwork: could not get %s: %s" % (key, e))
+
+	if data is None:
+		if fallback is None:
+			Response.Status = 404
+			return DataObject("", 'text/plain')
+		return Redirect(R(fallback))
+
+	if data.startswith('\x89PNG'):
+		return DataObject(data, 'image/png')
+	return DataObject(data, 'image/jpeg')
+
+# Fetches artwork from the backend into the cache. Only one fetch of each piece of artwork is
+# ever in flight - concurrent callers wait for that one.
+#
+# Returns the artwork - or None if the backend doesn't have it.
+def FetchCachedArtwork(kind, id, width, height):
+	key = ArtworkKey(kind, id, width, height)
+
+	ARTWORK_LOCK.acquire()
+	try:
+		done = ARTWORK_FLIGHTS.get(key)
+		startFlight = done is None
+		if startFlight:
+			done = ARTWORK_FLIGHTS[key] = Thread.Event()
+	finally:
+		ARTWORK_LOCK.release()
+
+	if not startFlight:
+		done.wait()
+		return LoadCachedArtwork(key)
+
+	try:
+		data = FetchArtwork(BackendArtworkUrl(kind, id, width, height))
+		if data is None:
+			RememberMissingArtwork(key)
+		else:
+			SaveCachedArtwork(key, data)
+		return data
+	finally:
+		ARTWORK_LOCK.acquire()
+		try:
+			del ARTWORK_FLIGHTS[key]
+		finally:
+			ARTWORK_LOCK.release()
+		done.set()
+
+def ArtworkKey(kind, id, width, height):
+	if width is None:
+		width = ""
+	if height is None:
+		height = ""
+	return "%s/%s/%sx%s" % (kind, id, width, height)
+
+def BackendArtworkUrl(kind, id, width, height):
+	backend = ArtworkBackend(kind, id)
+	if kind == 'preview':
+		chanId, startTime = id.split('/', 1)
+		url = "%sContent/GetPreviewImage?ChanId=%s&StartTime=%s" % (backend, chanId, startTime)
+	else:
+		url = "%sContent/GetRecordingArtwork?Inetref=%s&Type=%s" % (backend, id, kind)
+	if height:
+		url = url + "&Height=%s" % height
+	if width:
+		url = url + "&Width=%s" % width
+	return url
+
+# Returns the URL of the backend holding the recording (preview) or series (fanart etc.):
+def ArtworkBackend(kind, id):
+	index = RECORDING_INDEX
+	if not index is None:
+		if kind == 'preview':
+			recording = index.Lookup(id)
+			if not recording is None:
+				return recording.backend
+		else:
+			backend = index.inetrefBackends.get(id)
+			if not backend is None:
+				return backend
+	return PVR_URL
+
+# Returns the artwork - or None if the backend doesn't have it:
+def FetchArtwork(url):
+	try:
+		response = BackendRequest(url)
+	except BackendError, e:
+		if e.status == 404:
+			return None
+		raise
+	try:
+		return response.read()
+	finally:
+		response.close()
+
+def ArtworkFileName(key):
+	return "Artwork-%s" % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def LoadArtworkIndex():
+	global ARTWORK_ENTRIES, ARTWORK_BYTES
+	if not ARTWORK_ENTRIES is None:
+		return
+
+	ARTWORK_ENTRIES = collections.OrderedDict()
+	ARTWORK_BYTES = 0
+	savedEntries = Data.LoadObject(ARTWORK_INDEX_KEY)
+	if isinstance(savedEntries, list):
+		for key, size in savedEntries:
+			ARTWORK_ENTRIES[key] = size
+			ARTWORK_BYTES = ARTWORK_BYTES + size
+
+def LoadCachedArtwork(key):
+	ARTWORK_LOCK.acquire()
+	try:
+		LoadArtworkIndex()
+		size = ARTWORK_ENTRIES.pop(key, None)
+		if size is None:
+			return None
+		ARTWORK_ENTRIES[key] = size # now the most recently used
+	finally:
+		ARTWORK_LOCK.release()
+
+	data = Data.Load(ArtworkFileName(key), binary = True)
+	if data is None:
+		# Gone from the data store:
+		ForgetCachedArtwork(key)
+	return data
+
+def SaveCachedArtwork(key, data):
+	global ARTWORK_BYTES
+	if len(data) > ARTWORK_CACHE_SIZE:
+		return
+
+	Data.Save(ArtworkFileName(key), data, binary = True)
+
+	ARTWORK_LOCK.acquire()
+	try:
+		LoadArtworkIndex()
+		ARTWORK_BYTES = ARTWORK_BYTES - ARTWORK_ENTRIES.pop(key, 0) + len(data)
+		ARTWORK_ENTRIES[key] = len(data)
+
+		# Evict the least recently used artwork:
+		evictedKeys = []
+		while ARTWORK_BYTES > ARTWORK_CACHE_SIZE:
+			evictedKey, evictedSize = ARTWORK_ENTRIES.popitem(last = False)
+			ARTWORK_BYTES = ARTWORK_BYTES - evictedSize
+			evictedKeys.append(evictedKey)
+
+		ScheduleArtworkIndexSave()
+	finally:
+		ARTWORK_LOCK.release()
+
+	for evictedKey in evictedKeys:
+		Data.Remove(ArtworkFileName(evictedKey))
+
+def ForgetCachedArtwork(key):
+	global ARTWORK_BYTES
+	ARTWORK_LOCK.acquire()
+	try:
+		ARTWORK_BYTES = ARTWORK_BYTES - ARTWORK_ENTRIES.pop(key, 0)
+		ScheduleArtworkIndexSave()
+	finally:
+		ARTWORK_LOCK.release()
+
+# Saves ARTWORK_ENTRIES in a while - call it holding ARTWORK_LOCK:
+def ScheduleArtworkIndexSave():
+	global ARTWORK_SAVE_PENDING
+	if not ARTWORK_SAVE_PENDING:
+		ARTWORK_SAVE_PENDING = True
+		Thread.CreateTimer(ARTWORK_SAVE_DELAY, SaveArtworkIndex)
+
+def SaveArtworkIndex():
+	global ARTWORK_SAVE_PENDING
+	startTime = time.time()
+	ARTWORK_SAVE_LOCK.acquire()
+	try:
+		# (pickling the entries takes a while - so not while holding ARTWORK_LOCK)
+		ARTWORK_LOCK.acquire()
+		try:
+			entries = ARTWORK_ENTRIES.items()
+			ARTWORK_SAVE_PENDING = False
+		finally:
+			ARTWORK_LOCK.release()
+		Data.SaveObject(ARTWORK_INDEX_KEY, entries)
+	finally:
+		ARTWORK_SAVE_LOCK.release()
+	RecordTiming(PHASE_TIMINGS, "SaveArtworkIndex", time.time() - startTime)
+
+def IsCachedArtwork(key):
+	ARTWORK_LOCK.acquire()
+	try:
+		LoadArtworkIndex()
+		return key in ARTWORK_ENTRIES
+	finally:
+		ARTWORK_LOCK.release()
+
+def IsMissingArtwork(key):
+	retryTime = ARTWORK_MISSING.get(key)
+	return not retryTime is None and time.time() < retryTime
+
+def RememberMissingArtwork(key):
+	now = time.time()
+	ARTWORK_LOCK.acquire()
+	try:
+		ARTWORK_MISSING.pop(key, None)
+		ARTWORK_MISSING[key] = now + ARTWORK_MISSING_TIME # (so the keys stay in retry time order)
+
+		# Forget the keys we may ask for again - and the oldest ones, if there are too many:
+		while len(ARTWORK_MISSING) > ARTWORK_MISSING_SIZE or ARTWORK_MISSING.itervalues().next() <= now:
+			ARTWORK_MISSING.popitem(last = False)
+	finally:
+		ARTWORK_LOCK.release()
+
+####################################################################################################
+# Artwork prefetch:
+# =================
+# Even with the artwork cache, the first client to open a page has to wait for the backend to
+# produce each image on it, one request at a time.
+#
+# So artwork is fetched into the cache ahead of time by a small pool of PREFETCH_WORKERS
+# background threads:
+#    - when the recording index has been refreshed: the artwork of the first pages (by title
+#      and by date)
+#    - when a page is rendered: the artwork on it (the client will ask for it in a moment)
+#      and the artwork on the next page
+#
+# Each backend is only asked for PREFETCH_PER_BACKEND images at a time, so the prefetch doesn't
+# crowd out the foreground requests. When the queue is full, further prefetches are dropped.
+####################################################################################################
+
+PREFETCH_WORKERS = 4
+PREFETCH_PER_BACKEND = 2
+PREFETCH_QUEUE_SIZE = 200
+
+PREFETCH_QUEUE = Queue.Queue(PREFETCH_QUEUE_SIZE)
+PREFETCH_LOCK = Thread.Lock()
+PREFETCH_PENDING = set()	# the artwork keys in PREFETCH_QUEUE
+PREFETCH_STARTED = False
+BACKEND_SEMAPHORES = {}	# {backend URL : Semaphore}
+
+def PrefetchArtwork(kind, id, width, height):
+	global PREFETCH_STARTED
+	if not (USE_ARTWORK_CACHE and PREFETCH_ARTWORK) or id is None:
+		return
+
+	key = ArtworkKey(kind, id, width, height)
+	if IsMissingArtwork(key) or IsCachedArtwork(key):
+		return
+
+	PREFETCH_LOCK.acquire()
+	try:
+		if not PREFETCH_STARTED:
+			for i in range(PREFETCH_WORKERS):
+				Thread.Create(PrefetchWorker)
+			PREFETCH_STARTED = True
+
+		if key in PREFETCH_PENDING:
+			return
+		try:
+			PREFETCH_QUEUE.put_nowait((kind, id, width, height))
+			PREFETCH_PENDING.add(key)
+		except Queue.Full:
+			pass
+	finally:
+		PREFETCH_LOCK.release()
+
+def PrefetchWorker():
+	while True:
+		kind, id, width, height = PREFETCH_QUEUE.get()
+		key = ArtworkKey(kind, id, width, height)
+
+		PREFETCH_LOCK.acquire()
+		try:
+			PREFETCH_PENDING.discard(key)
+		finally:
+			PREFETCH_LOCK.release()
+
+		if IsMissingArtwork(key) or IsCachedArtwork(key):
+			continue
+
+		semaphore = GetBackendSemaphore(BackendArtworkUrl(kind, id, width, height))
+		semaphore.acquire()
+		try:
+			FetchCachedArtwork(kind, id, width, height)
+		except Exception, e:
+			Log("PrefetchWorker: could not get %s: %s" % (key, e))
+		finally:
+			semaphore.release()
+
+def GetBackendSemaphore(url):
+	parsedUrl = urlparse.urlparse(url)
+	backend = "%s://%s" % (parsedUrl.scheme, parsedUrl.netloc)
+
+	PREFETCH_LOCK.acquire()
+	try:
+		semaphore = BACKEND_SEMAPHORES.get(backend)
+		if semaphore is None:
+			semaphore = BACKEND_SEMAPHORES[backend] = Thread.Semaphore(limit = PREFETCH_PER_BACKEND)
+		return semaphore
+	finally:
+		PREFETCH_LOCK.release()
+
+def PrefetchRecordingArtwork(recordings):
+	for recording in recordings:
+		if not recording.previewUrl is None:
+			PrefetchArtwork('preview', recording.id, SCREENSHOT_ICON_WIDTH, SCREENSHOT_ICON_HEIGHT)
+
+# Prefetches the artwork of the named subdirectories of a group tree node (see GroupRecordingsBy):
+def PrefetchGroupArtwork(index, groupByKey, entries):
+	if groupByKey != "Title" or not DETECT_SERIES_BY_TITLE:
+		return # static resources only
+
+	for entry in entries:
+		if entry.recordingId is None:
+			PrefetchArtwork('fanart', entry.node.inetref, SCREENSHOT_ICON_WIDTH, SCREENSHOT_ICON_HEIGHT)
+		else:
+			PrefetchRecordingArtwork([index.Lookup(entry.recordingId)])
+
+# Prefetches the artwork of the first pages of a newly refreshed index:
+def PrefetchIndexArtwork(index):
+	if not (USE_ARTWORK_CACHE and PREFETCH_ARTWORK):
+		return
+
+	pageSize = 2 * MAX_EPISODES_PER_PAGE
+
+	titleTree = index.groupTrees[('Title',)]
+	PrefetchGroupArtwork(index, "Title", titleTree.entries[:pageSize])
+
+	newest = index.SortedView({}, 'StartTime', True)
+	PrefetchRecordingArtwork(newest.recordings[:pageSize])
 
 
 #return cgi.escape(str, quote=True).encode('ascii', 'xmlcharrefreplace')
@@ -487,10 +1271,15 @@ def first_lower(s):
 #
 # The resulting list of recordings is sorted by the element identified by the sortKeyName parameter
 # (another XPATH expression)
+#
+# The pages after the first are identified by a cursor (see SortedView.Cursor) rather than an
+# offset, so browsing continues at the right place even if the recording list has been refreshed
+# in the meantime.
 ####################################################################################################
 @route('/video/mythrecordings/GetRecordingList', filterBy = dict, startWith = int, sortReverse = bool)
-def GetRecordingList(filterBy = {}, sortKeyName = None, sortReverse = True, startWith = 0, seriesInetRef = None, staticBackground = None):
-	Log("GetRecordingList(filterBy = %s, sortKeyName = %s, sortReverse = %s, startWith = %s, seriesInetRef = %s, staticBackground = %s)" % (filterBy, sortKeyName, sortReverse, startWith, seriesInetRef, staticBackground))
+@instrumented
+def GetRecordingList(filterBy = {}, sortKeyName = None, sortReverse = True, startWith = 0, cursor = None, seriesInetRef = None, staticBackground = None):
+	Log("GetRecordingList(filterBy = %s, sortKeyName = %s, sortReverse = %s, startWith = %s, cursor = %s, seriesInetRef = %s, staticBackground = %s)" % (filterBy, sortKeyName, sortReverse, startWith, cursor, seriesInetRef, staticBackground))
 
 	if sortReverse is None:
 		sortReverse = True
@@ -502,63 +1291,225 @@ def GetRecordingList(filterBy = {}, sortKeyName = None, sortReverse = True, star
 		art = backgroundUrl
 	)
 	
-	recordings = list(GetMythTVRecordings(filterBy))
+	view = GetRecordingIndexFor(filterBy).SortedView(filterBy, sortKeyName, sortReverse)
+	recordings = view.recordings
 
-	# Sorting the list:
-	if (sortKeyName is not None):
-		recordings.sort(key=lambda rec: rec.find(sortKeyName).text, reverse=sortReverse)
-	
-	for recording in recordings[int(startWith):]:
+	if cursor:
+		start = view.Find(cursor)
+	else:
+		start = int(startWith)
+
+	end = len(recordings)
+	if USE_PAGING:
+		end = min(end, start + MAX_EPISODES_PER_PAGE)
+
+	for recording in recordings[start:end]:
 		recordingEntry = Recording(recording, seriesInetRef = seriesInetRef)
 		oc.add(recordingEntry)
-		if USE_PAGING and len(oc) >= MAX_EPISODES_PER_PAGE:
-			oc.add(
-				NextPageObject(
-					key = 
-						Callback(
-							GetRecordingList,
-							filterBy = filterBy,
-							sortKeyName = sortKeyName,
-							sortReverse = sortReverse,
-							startWith = int(startWith) + len(oc),
-							seriesInetRef = seriesInetRef,
-							staticBackground = staticBackground
-						),
-					title = "Next..."
-				)
+
+	if end < len(recordings):
+		oc.add(
+			NextPageObject(
+				key = 
+					ViewCallback(
+						"GetRecordingList",
+						filterBy = filterBy,
+						sortKeyName = sortKeyName,
+						sortReverse = sortReverse,
+						cursor = view.Cursor(end - 1),
+						seriesInetRef = seriesInetRef,
+						staticBackground = staticBackground
+					),
+				title = "Next..."
 			)
-			break
+		)
+
+		# Warm the artwork of the next page (see "Artwork prefetch" below):
+		PrefetchRecordingArtwork(recordings[end:end + MAX_EPISODES_PER_PAGE])
 	return oc
 
-def all_same(items):
-	if len(items) == 0:
-		return True
-	first =items[0]
-	for item in items:
-		if not item == first:
-			return False
-	return True
+####################################################################################################
+# View registry:
+# ==============
+# Instead of the whole view definition (filterBy, groupByList, sort order, seriesInetRef and
+# staticBackground), the directory and next-page entries made by GroupRecordingsBy and
+# GetRecordingList only put a short view ID - and the page position - into their URLs (see
+# ViewCallback). The View route looks the definition up again in VIEW_REGISTRY.
+#
+# The view ID is a hash of the definition, so the same view gets the same ID every time: the
+# IDs stay valid when the recording index is refreshed, and when the plug-in is restarted (the
+# registry is kept in the Plex data store - saved in the background, VIEW_SAVE_DELAY seconds
+# after the first new view, so no page waits for it). Only the VIEW_REGISTRY_SIZE most recently
+# used definitions are kept - a URL with an ID that has been forgotten (or never seen, like one
+# from another server) just gets a message asking the user to browse there again.
+#
+# The views themselves (group tree nodes and sorted recording lists) are still cached by each
+# recording index - see RecordingIndex.GroupTree and RecordingIndex.SortedView.
+#
+# The GroupRecordingsBy and GetRecordingList routes still take the full definition, so old URLs
+# (in the Plex history, say) keep working.
+####################################################################################################
+
+VIEW_REGISTRY_KEY = "dk.schaumburg-it.plexapp.mythrecordings.ViewRegistry"
+VIEW_REGISTRY_SIZE = 5000
+VIEW_ID_LENGTH = 12
+VIEW_SAVE_DELAY = 30
+
+VIEW_REGISTRY_LOCK = Thread.Lock()
+VIEW_REGISTRY = None			# {view ID : (route name, arguments)} OrderedDict, least recently used first
+VIEW_SAVE_PENDING = False		# whether a save of VIEW_REGISTRY has been scheduled
+VIEW_SAVE_LOCK = Thread.Lock()	# held while saving
+
+@route('/video/mythrecordings/View', startWith = int)
+def View(viewId, startWith = 0, cursor = None):
+	definition = LookupView(viewId)
+	if definition is None:
+		Log("View(viewId = %s): unknown view" % viewId)
+		return MessageContainer(L2("VIEW_EXPIRED"), L2("VIEW_EXPIRED_MESSAGE"))
+
+	routeName, args = definition
+	args = dict(args)
+	if startWith:
+		args["startWith"] = startWith
+	if cursor:
+		args["cursor"] = cursor
+	return VIEW_ROUTES[routeName](**args)
+
+# Returns a Callback showing (a page of) the view defined by the route name and arguments:
+def ViewCallback(routeName, startWith = 0, cursor = None, **args):
+	viewId = RegisterView(routeName, args)
+	pageArgs = {}
+	if startWith:
+		pageArgs["startWith"] = startWith
+	if cursor:
+		pageArgs["cursor"] = cursor
+	return Callback(View, viewId = viewId, **pageArgs)
+
+def ViewId(routeName, args):
+	definition = json.dumps([routeName, args], sort_keys = True)
+	return hashlib.sha1(definition).hexdigest()[:VIEW_ID_LENGTH]
+
+def RegisterView(routeName, args):
+	global VIEW_SAVE_PENDING
+	viewId = ViewId(routeName, args)
+	VIEW_REGISTRY_LOCK.acquire()
+	try:
+		LoadViewRegistry()
+		if VIEW_REGISTRY.pop(viewId, None) is None and not VIEW_SAVE_PENDING:
+			VIEW_SAVE_PENDING = True
+			Thread.CreateTimer(VIEW_SAVE_DELAY, SaveViewRegistry)
+		VIEW_REGISTRY[viewId] = (routeName, args) # now the most recently used
+
+		# Forget the least recently used views:
+		while len(VIEW_REGISTRY) > VIEW_REGISTRY_SIZE:
+			VIEW_REGISTRY.popitem(last = False)
+	finally:
+		VIEW_REGISTRY_LOCK.release()
+	return viewId
+
+# Returns (route name, arguments) - or None if we don't know the view:
+def LookupView(viewId):
+	VIEW_REGISTRY_LOCK.acquire()
+	try:
+		LoadViewRegistry()
+		definition = VIEW_REGISTRY.pop(viewId, None)
+		if definition is None:
+			CountCacheEvent("view id miss")
+			return None
+		VIEW_REGISTRY[viewId] = definition # now the most recently used
+		CountCacheEvent("view id hit")
+		return definition
+	finally:
+		VIEW_REGISTRY_LOCK.release()
+
+def LoadViewRegistry():
+	global VIEW_REGISTRY
+	if not VIEW_REGISTRY is None:
+		return
+
+	VIEW_REGISTRY = collections.OrderedDict()
+	savedViews = Data.LoadObject(VIEW_REGISTRY_KEY)
+	if isinstance(savedViews, list):
+		for viewId, definition in savedViews:
+			VIEW_REGISTRY[viewId] = definition
+
+# Saves the registry (on the timer started by RegisterView):
+def SaveViewRegistry():
+	global VIEW_SAVE_PENDING
+	startTime = time.time()
+	VIEW_SAVE_LOCK.acquire()
+	try:
+		# (pickling the views takes a while - so not while holding up RegisterView and LookupView)
+		VIEW_REGISTRY_LOCK.acquire()
+		try:
+			views = VIEW_REGISTRY.items()
+			VIEW_SAVE_PENDING = False
+		finally:
+			VIEW_REGISTRY_LOCK.release()
+		Data.SaveObject(VIEW_REGISTRY_KEY, views)
+	finally:
+		VIEW_SAVE_LOCK.release()
+	RecordTiming(PHASE_TIMINGS, "SaveViewRegistry", time.time() - startTime)
+
+VIEW_ROUTES = {
+	"GroupRecordingsBy": GroupRecordingsBy,
+	"GetRecordingList": GetRecordingList
+}
+
+####################################################################################################
+# Search:
+# =======
+# Returns the recordings matching a search query, best matches first (see "Search index" below).
+#
+# Return:
+#    ObjectContainer
+####################################################################################################
+@route('/video/mythrecordings/Search', startWith = int)
+@instrumented
+def Search(query = "", startWith = 0):
+	Log("Search(query = %s, startWith = %s)" % (query, startWith))
+
+	recordings = InternalGetRecordedList().Search(query)
+	if len(recordings) == 0:
+		return ObjectContainer(header = L2("SEARCH"), message = F2("SEARCH_NO_RESULTS", query))
+
+	oc = ObjectContainer(
+		title2 = F2("SEARCH_RESULTS", query),
+		art = R(MYTHTV_BACKGROUND)
+	)
+
+	start = int(startWith)
+	end = len(recordings)
+	if USE_PAGING:
+		end = min(end, start + MAX_EPISODES_PER_PAGE)
+
+	for recording in recordings[start:end]:
+		oc.add(Recording(recording))
+
+	if end < len(recordings):
+		oc.add(
+			NextPageObject(
+				key = Callback(Search, query = query, startWith = end),
+				title = "Next..."
+			)
+		)
+
+		# Warm the artwork of the next page (see "Artwork prefetch" below):
+		PrefetchRecordingArtwork(recordings[end:end + MAX_EPISODES_PER_PAGE])
+	return oc
 
 ####################################################################################################
-def Recording(recording, seriesInetRef = None, staticBackground = None):
-	Log("Recording(recording = %s, seriesInetRef = %s, staticBackground = %s)" % (identify_recording(recording), seriesInetRef, staticBackground))
+def Recording(recording, seriesInetRef = None, staticBackground = None, playLocally = False):
+	Log("Recording(recording = %s, seriesInetRef = %s, staticBackground = %s, playLocally = %s)" % (identify_recording(recording), seriesInetRef, staticBackground, playLocally))
+	startTime = time.time()
 	
 	# Mandatory properties: Title, Channel, StartTime, EndTime:
 	# =========================================================
-	showname = GetField(recording, 'Title')
-	chanId = GetField(recording, 'Channel/ChanId')
-	programStart = GetField(recording, 'StartTime')
-	programEnd = GetField(recording, 'EndTime')
-	recordingStart = GetField(recording, 'Recording/StartTs')
-	recordingEnd = GetField(recording, 'Recording/EndTs')
-
-	shouldStart = datetime.datetime.strptime(programStart,"%Y-%m-%dT%H:%M:%SZ")
-	didStart = datetime.datetime.strptime(recordingStart,"%Y-%m-%dT%H:%M:%SZ")
-	shouldEnd = datetime.datetime.strptime(programEnd,"%Y-%m-%dT%H:%M:%SZ")
-	didEnd = datetime.datetime.strptime(recordingEnd,"%Y-%m-%dT%H:%M:%SZ")
+	showname = recording.title
+	chanId = recording.chanId
+	recordingStart = recording.recordingStart
 
-	fileName = GetField(recording, 'FileName')
-	storageGroup = GetField(recording, 'Recording/StorageGroup')
+	shouldStart = recording.shouldStart
 
 	# Playback URL:
 	# =============
@@ -573,9 +1524,15 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 	respectMasterBackendOverride = Prefs['respectMasterBackendOverride']
 	
 	if respectMasterBackendOverride:
-		playbackURL = PVR_URL + 'Content/GetFile?StorageGroup=%s&FileName=%s' % (storageGroup,fileName,)
+		playbackURL = recording.fileUrl
 	else:
-		playbackURL = PVR_URL + 'Content/GetRecording?ChanId=%s&StartTime=%s' % (chanId,recordingStart,)
+		playbackURL = recording.streamUrl
+
+	# ...unless we can get the file directly (see "Local playback" below):
+	if playLocally:
+		localURL = LocalRecordingUrl(recording)
+		if not localURL is None:
+			playbackURL = localURL
 
 	# Optional properties:
 	# ====================	
@@ -585,7 +1542,7 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 	# =========
 
 	try:
-		epname = GetField(recording, 'SubTitle')
+		epname = recording.subTitle
 		epname = "%s (%s)" % (epname, shouldStart.strftime('%Y-%m-%d'))
 	except:
 		Warning('Recording: Recording: "%s" had no SubTitle - using date' % showname)
@@ -593,21 +1550,20 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 
 	# Still recording?
 	# ================
+	# (the timing metrics below are computed when the recording index is built - see
+	# RecordingEntry - only this depends on the current time)
 
-	utcnow = datetime.datetime.utcnow()
-	timeSinceEnd = utcnow - didEnd
-	stillRecording = timeSinceEnd < datetime.timedelta(hours=0, minutes=0,seconds=30)
+	stillRecording = StillRecording(recording, datetime.datetime.utcnow())
 
 	# Duration:
 	# =========
 
-	try:
-		if stillRecording:
-			delta = didEnd - didStart
-		else:
-			delta = shouldEnd - didStart + datetime.timedelta(hours=0, minutes=5,seconds=0)
+	if stillRecording:
+		delta = recording.recordedDuration
+	else:
+		delta = recording.scheduledDuration
 
-	except:
+	if delta is None:
 		Warning('Recording: Recording: "%s", Duration error, Unexpected error' % showname)
 		delta = datetime.timedelta(hours=3, minutes=0,seconds=0)
 
@@ -617,8 +1573,8 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 	# ===============================
 
 	try:
-		missedAtStart = didStart - shouldStart # negative means OK
-		missedAtEnd = shouldEnd - didEnd # negative means OK
+		missedAtStart = recording.missedAtStart # negative means OK
+		missedAtEnd = recording.missedAtEnd # negative means OK
 		# generate warning:
 		missedStart = missedAtStart > datetime.timedelta(hours=0, minutes=0,seconds=0)
 		missedEnd = missedAtEnd > datetime.timedelta(hours=0, minutes=0,seconds=0)
@@ -646,7 +1602,7 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 	# Description:
 	# ============
 	try:
-		descr = GetField(recording, 'Description').strip() 
+		descr = recording.description.strip() 
 		if descr is None:
 			descr = ""
 	except:
@@ -654,16 +1610,6 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 		descr = ""
 
 
-	# ChanId:
-	# =======
-	try:
-		channel = GetField(recording, 'Channel/ChanId')
-		if channel == '0':
-			channel = None
-	except:
-		Warning('Recording: Recording: "%s", Could not get channel ID' % showname)			
-		channel = None
-
 	
 	# Title + subtitle:
 	# =================
@@ -684,19 +1630,14 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 
 	# Screenshot:
 	# ===========
-	if not channel is None and not recordingStart is None:
-		screenshotUrl = PVR_URL + '/Content/GetPreviewImage?ChanId=%s&StartTime=%s' % (channel, recordingStart)
-		if SCREENSHOT_ICON_HEIGHT:
-			screenshotUrl = screenshotUrl + "&Height=%s" % SCREENSHOT_ICON_HEIGHT
-		if SCREENSHOT_ICON_WIDTH:
-			screenshotUrl = screenshotUrl + "&Width=%s" % SCREENSHOT_ICON_WIDTH
-		thumb = Resource.ContentsOfURLWithFallback(url = screenshotUrl, fallback = UNKNOWN_SERIES_BACKGROUND)
-		backgroundUrl = Resource.ContentsOfURLWithFallback(url = screenshotUrl, fallback = UNKNOWN_SERIES_BACKGROUND)
+	if not recording.previewUrl is None:
+		thumb = GetPreviewImage(recording, UNKNOWN_SERIES_BACKGROUND)
+		backgroundUrl = GetPreviewImage(recording, UNKNOWN_SERIES_BACKGROUND)
 	else:
 		thumb = R(MYTHTV_ICON)
 		backgroundUrl = R(MYTHTV_BACKGROUND)
 
-	return VideoClipObject(
+	videoClip = VideoClipObject(
                 title = Sanitize(header),
 		tagline = tagline,
                 summary = warning + descr,
@@ -720,40 +1661,103 @@ def Recording(recording, seriesInetRef = None, staticBackground = None):
 		]
         )
 
+	RecordTiming(PHASE_TIMINGS, "Recording", time.time() - startTime)
+	return videoClip
+
 def Sanitize(str):
 	if str is None:
 		return None
 	#str = str.replace("æ", "ae").replace("ø", "oe").replace("å", "aa").replace("Æ", "Ae").replace("Ø", "Oe").replace("Å", "Aa")
 	return str
 
+####################################################################################################
+# Local playback:
+# ===============
+# Normally Plex plays the recordings from the backend (see the playback URL in Recording), so
+# every byte of a recording is streamed by mythbackend.
+#
+# If the storage groups are also mounted on the Plex server (over NFS, say), the localStorageGroups
+# preference can map them to the local directories:
+#
+#    Default=/mnt/mythtv/recordings, Default=/mnt/mythtv/recordings2, Archive=/mnt/archive
+#
+# (a storage group spanning several directories gets an entry for each). The recordings in a
+# mapped storage group are then played directly from the file - if the file is there, and Plex
+# may read it. If not (the share isn't mounted, say), they're played from the backend as usual.
+#
+# Looking for the file means asking the file server - which may be slow, or (with a dead hard
+# mount) never answer. So it is only done for the recording about to be played (RecordingInfo),
+# not for every recording in a list.
+####################################################################################################
+
+LOCAL_STORAGE_GROUPS = {}	# {storage group : [local directory, ...]} - see ValidatePrefs
+
+# Returns the file: URL of the recording - or None if the file isn't available locally:
+def LocalRecordingUrl(recording):
+	directories = LOCAL_STORAGE_GROUPS.get(recording.storageGroup)
+	if not directories or not recording.fileName:
+		return None
+
+	for directory in directories:
+		path = os.path.normpath(os.path.join(directory, recording.fileName))
+		if not path.startswith(os.path.join(directory, '')):
+			continue # (a file name from the backend shouldn't lead out of the directory - but still)
+		if os.path.isfile(path) and os.access(path, os.R_OK):
+			CountCacheEvent("local file hit")
+			if isinstance(path, unicode):
+				path = path.encode('utf-8')
+			return urlparse.urljoin('file:', urllib.pathname2url(path))
+
+	CountCacheEvent("local file miss")
+	return None
+
 ####################################################################################################
 # RecordingInfo:
 # ==============
 # Returns an ObjectContainer with metadata about a recording, as required by the VideoClipObject.
 # The purpose is a bit mysterious, but it's required.
 #
+# The recording is looked up in the recording index - only recordings that aren't in the index
+# yet (or all of them, while there is no index to serve) are fetched from the backend.
+#
 # Return:
 #    ObjectContainer
 ####################################################################################################
 @route('/video/mythrecordings/GetRecordingInfo', allow_sync=True)
+@instrumented
 def RecordingInfo(chanId, startTime, seriesInetRef = None):
 	Log('RecordingInfo(chanId="%s", startTime="%s" seriesInetRef="%s")' % (chanId, startTime, seriesInetRef))
-	url = PVR_URL + 'Dvr/GetRecorded?StartTime=%s&ChanId=%s' % (startTime, chanId)
-	request = urllib2.Request(url, headers={"Accept" : "application/xml"})
-	u = urllib2.urlopen(request)
-	tree = ET.parse(u)
-	root = tree.getroot()
-
-	recording = root #.findall('Programs/Program')
+	recording = FindRecording(chanId, startTime)
 
 	# Background image:
 	# =================
 	backgroundUrl = GetSeriesBackground(seriesInetRef, None)
 
-	recording_object = Recording(recording, seriesInetRef)
+	recording_object = Recording(recording, seriesInetRef, playLocally = True)
 	return ObjectContainer(objects=[recording_object], art=backgroundUrl)
 
 
+# Asks each backend in turn for the recording:
+def InternalGetRecordedUnCached(chanId, startTime):
+	error = None
+	for backend in BACKEND_URLS:
+		try:
+			return FetchRecording(backend, chanId, startTime)
+		except Exception, e:
+			error = e
+	raise error
+
+def FetchRecording(backend, chanId, startTime):
+	url = backend + 'Dvr/GetRecorded?StartTime=%s&ChanId=%s' % (startTime, chanId)
+	stream = BackendRequest(url, accept = "application/xml")
+	try:
+		tree = ET.parse(stream)
+	finally:
+		stream.close()
+	root = tree.getroot()
+
+	return MakeRecordingEntry(root, backend)
+
 ####################################################################################################
 # GetMythTVRecordings:
 # ====================
@@ -764,20 +1768,17 @@ def RecordingInfo(chanId, startTime, seriesInetRef = None):
 #                       retrieve the value of a field)
 ####################################################################################################
 def GetMythTVRecordings(filterBy):
-	root = InternalGetRecordedList()
-	
+	return FilterRecordings(GetRecordingIndexFor(filterBy), filterBy)
+
+def FilterRecordings(index, filterBy):
+	# If the filter selects a group in one of the group trees, we already know the result:
+	node = index.FindGroupNode(filterBy)
+	if not node is None:
+		return index.Members(node)
+
 	# Loop through recordings, filtering as specified:
-	recordings = root.findall('Programs/Program')
 	result = []
-	for recording in recordings:
-		if recording.find('Recording/RecGroup').text == 'Deleted':
-			continue
-		if recording.find('Recording/RecGroup').text == 'LiveTV':
-			continue
-		if recording.find('FileSize').text == '0':
-			continue
-		if recording.find('Title').text == 'Unknown':
-			continue
+	for recording in index.recordings:
 		if not Match(filterBy, recording):
 			continue
 
@@ -786,36 +1787,1250 @@ def GetMythTVRecordings(filterBy):
 	return result
 
 RECORDINGS_CACHE_KEY = "dk.schaumburg-it.plexapp.mythrecordings.AllRecordings"
-RECORDINGS_CACHE_TIMESTAMP_KEY = "dk.schaumburg-it.plexapp.mythrecordings.AllRecordings.Timestamp"
+RECORDINGS_CACHE_TIMESTAMP_KEY = "dk.schaumburg-it.plexapp.mythrecordings.AllRecordings.Timestamp" # only removed, these days
+
+####################################################################################################
+# Recordings cache:
+# =================
+# The recording index is kept in memory until it is DATA_CACHE_TIME seconds old. It is also saved
+# in the Plex data cache (see "Recording snapshot" below), but that is only read on startup.
+#
+# When it gets older than that, it has to be refreshed from the MythTV backend - which is slow
+# for a large library. With BACKGROUND_REFRESH set, the old index is served while a background
+# thread does the refresh - unless the index is more than MAX_STALE_TIME seconds old, in which
+# case the caller has to wait for the refresh.
+#
+# Several backends:
+# -----------------
+# The recordings can come from several backends (BACKEND_URLS: the server and port preferences,
+# followed by the otherBackends preference) - a master and its slaves, or the backends of
+# different households. The recorded list of each backend is kept separately (see
+# BackendRecordings), and the recording index merges them.
+#
+# Each backend is refreshed independently, by a thread of its own, and the index is republished
+# as soon as any one of them has been refreshed - so a slow or dead backend doesn't hold up the
+# others:
+#    - callers waiting for a refresh only wait BACKEND_WAIT_TIME seconds for the slow backends
+#      (unless no backend has delivered any recordings yet, or the recordings we have of a slow
+#      backend are more than MAX_STALE_TIME seconds old - see CanServeWithout)
+#    - a backend that fails keeps its previous recordings (if any), and isn't asked again until
+#      they are due for a refresh anyway
+#
+# There is never more than one refresh of a backend in flight: callers arriving during a refresh
+# wait for (or, in the background case, simply leave it to) the one already running.
+####################################################################################################
+
+BACKEND_WAIT_TIME = 10
+
+# The index built from the most recently fetched (or loaded) recorded lists:
+RECORDING_INDEX = None
+
+# The refreshes in flight, and the lock protecting them:
+REFRESH_FLIGHTS = {}		# {backend URL : RefreshFlight}
+REFRESH_LOCK = Thread.Lock()
+
+# Held while publishing a new RECORDING_INDEX (and while saving it):
+PUBLISH_LOCK = Thread.Lock()
+SNAPSHOT_LOCK = Thread.Lock()
+
+class RefreshFlight(object):
+	def __init__(self, url, full = False):
+		self.url = url
+		self.full = full		# fetch the full list, rather than syncing
+		self.again = None		# None, or whether to fetch the full list - see RefreshBackend
+		self.done = Thread.Event()
+		self.error = None
 
 def InternalGetRecordedList():
 	# Consult cache:
+	if not USE_DATA_CACHE:
+		return RefreshRecordingIndex(wait = True, everything = True)
+
+	index = ServableRecordingIndex()
+	if not index is None:
+		return index
+
+	#Log("CACHING: Cached tree expired - loading from server")
+	CountCacheEvent("index miss")
+	return RefreshRecordingIndex(wait = True)
+
+# Returns the recording index, if it can be served without waiting for the backends (starting a
+# refresh in the background, if one is due) - or None:
+def ServableRecordingIndex():
+	index = RECORDING_INDEX
+	if index is None:
+		index = LoadCachedRecordingIndex()
+
+	# (an index without a fullTimestamp has no recordings from any backend yet)
+	if index is None or index.fullTimestamp is None:
+		return None
+
+	age = (datetime.datetime.now() - index.timestamp).total_seconds()
+	if age < DATA_CACHE_TIME:
+		CountCacheEvent("index hit")
+		if len(index.sources) < len(BACKEND_URLS):
+			RefreshRecordingIndex(wait = False) # a backend has been added
+		return index
+	if BACKGROUND_REFRESH and age < MAX_STALE_TIME:
+		#Log("CACHING: Cached tree expired - refreshing in the background")
+		CountCacheEvent("index stale")
+		RefreshRecordingIndex(wait = False)
+		return index
+	return None
+
+# Refreshes the recordings of the backends that are due for a refresh (or all of them, if
+# everything is set):
+def RefreshRecordingIndex(wait, everything = False):
+	index = RECORDING_INDEX
+	flights = []
+
+	REFRESH_LOCK.acquire()
+	try:
+		for url in BACKEND_URLS:
+			source = None
+			if not index is None:
+				source = index.Source(url)
+			due = everything or source is None or \
+				(datetime.datetime.now() - source.timestamp).total_seconds() >= DATA_CACHE_TIME or \
+				(wait and source.fullTimestamp is None)
+			if not due:
+				continue
+
+			flight = REFRESH_FLIGHTS.get(url)
+			if flight is None:
+				flight = REFRESH_FLIGHTS[url] = RefreshFlight(url)
+				Thread.Create(RunRefreshFlight, flight = flight)
+			flights.append(flight)
+	finally:
+		REFRESH_LOCK.release()
+
+	if not wait:
+		return None
+
+	# Give the slow backends BACKEND_WAIT_TIME seconds...
+	deadline = time.time() + BACKEND_WAIT_TIME
+	for flight in flights:
+		flight.done.wait(max(0, deadline - time.time()))
+
+	# ...unless we can't show the recordings without them:
+	for flight in flights:
+		if not CanServeWithout(flight.url):
+			flight.done.wait()
+	index = RECORDING_INDEX
+
+	if index is None or index.fullTimestamp is None:
+		for flight in flights:
+			if not flight.error is None:
+				raise flight.error
+		raise Exception("No recordings from any backend")
+	return index
+
+# Whether RECORDING_INDEX may be served while a backend is being refreshed: only if it has
+# recordings from some backend, and those of this backend (if any) are less than MAX_STALE_TIME
+# seconds old:
+def CanServeWithout(url):
+	index = RECORDING_INDEX
+	if index is None or index.fullTimestamp is None:
+		return False
+	source = index.Source(url)
+	return source is None or (datetime.datetime.now() - source.timestamp).total_seconds() < MAX_STALE_TIME
+
+# Starts a refresh of one backend, because something has changed there (see "Backend events") -
+# unless a refresh is in flight already, in which case another one follows it (as it may have
+# fetched the list before the change):
+def RefreshBackend(url, full = False):
+	REFRESH_LOCK.acquire()
+	try:
+		flight = REFRESH_FLIGHTS.get(url)
+		if flight is None:
+			flight = REFRESH_FLIGHTS[url] = RefreshFlight(url, full)
+			Thread.Create(RunRefreshFlight, flight = flight)
+		else:
+			flight.again = full or bool(flight.again)
+	finally:
+		REFRESH_LOCK.release()
+
+def RunRefreshFlight(flight):
+	current = None
+	if not RECORDING_INDEX is None:
+		current = RECORDING_INDEX.Source(flight.url)
+
+	try:
+		source = FetchBackendRecordings(flight.url, current, flight.full)
+	except Exception, e:
+		Log("RefreshRecordingIndex: refresh of %s failed: %s" % (flight.url, e))
+		flight.error = e
+
+		# Keep the recordings we've got (if any) - and don't ask again until they're due anyway:
+		if current is None:
+			source = BackendRecordings(flight.url, [], datetime.datetime.now(), None, str(e))
+		else:
+			source = BackendRecordings(flight.url, current.entries, datetime.datetime.now(), current.fullTimestamp, str(e))
+
+	try:
+		index = PublishBackendRecordings(source)
+		if flight.error is None:
+			if USE_DATA_CACHE and (current is None or not source.entries is current.entries):
+				#Log("CACHING: Saving cached tree")
+				SaveRecordingSnapshot()
+			PrefetchIndexArtwork(index)
+
+			# Once somebody has searched, have the search index ready for the next search:
+			if SEARCH_USED:
+				index.GetSearchIndex()
+	except Exception, e:
+		Log("RefreshRecordingIndex: could not publish the recordings of %s: %s" % (flight.url, e))
+		if flight.error is None:
+			flight.error = e
+
+	REFRESH_LOCK.acquire()
+	try:
+		del REFRESH_FLIGHTS[flight.url]
+		if not flight.again is None:
+			again = REFRESH_FLIGHTS[flight.url] = RefreshFlight(flight.url, flight.again)
+			Thread.Create(RunRefreshFlight, flight = again)
+	finally:
+		REFRESH_LOCK.release()
+	flight.done.set()
+
+# Replaces the recordings of one backend in RECORDING_INDEX - if replacing is given, only if they
+# are still the ones in RECORDING_INDEX (otherwise, None is returned):
+def PublishBackendRecordings(source, replacing = None):
+	global RECORDING_INDEX
+
+	PUBLISH_LOCK.acquire()
+	try:
+		index = RECORDING_INDEX
+		sources = []
+		current = None
+		if not index is None:
+			sources = [other for other in index.sources if other.url != source.url]
+			current = index.Source(source.url)
+		if not replacing is None and not current is replacing:
+			return None
+
+		# Never replace newer recordings (a refresh may have completed while this one was loading):
+		if not current is None and current.timestamp > source.timestamp:
+			return index
+
+		# (the rules may have changed while the recordings were loading)
+		source = source.WithEntries(ApplyTitleRules(source.entries))
+
+		sources.append(source)
+		sources.sort(key = lambda other: BackendOrder(other.url))
+
+		if not current is None and current.entries is source.entries:
+			RECORDING_INDEX = index.WithSources(sources) # nothing has changed
+		else:
+			RECORDING_INDEX = RecordingIndex(sources)
+		return RECORDING_INDEX
+	finally:
+		PUBLISH_LOCK.release()
+
+# Derives the titles, subtitles and categories of the recordings in RECORDING_INDEX anew, after
+# the title rules have changed:
+def RederiveRecordingIndex():
+	global RECORDING_INDEX
+
+	startTime = time.time()
+	PUBLISH_LOCK.acquire()
+	try:
+		index = RECORDING_INDEX
+		if index is None:
+			return
+		RECORDING_INDEX = RecordingIndex([source.WithEntries(ApplyTitleRules(source.entries)) for source in index.sources])
+	finally:
+		PUBLISH_LOCK.release()
+
+	PUSHDOWN_LOCK.acquire()
+	try:
+		PUSHDOWN_INDEXES.clear()
+	finally:
+		PUSHDOWN_LOCK.release()
+	RecordTiming(PHASE_TIMINGS, "RederiveRecordingIndex", time.time() - startTime)
+
+# Returns the entries, with the ones derived with other rules than TITLE_RULES replaced:
+def ApplyTitleRules(entries):
+	rules = TITLE_RULES
+	for entry in entries:
+		if not entry.rules is rules:
+			break
+	else:
+		return entries
+	return [entry if entry.rules is rules else entry.WithRules(rules) for entry in entries]
+
+def BackendOrder(url):
+	if url in BACKEND_URLS:
+		return BACKEND_URLS.index(url)
+	return len(BACKEND_URLS)
+
+def LoadCachedRecordingIndex():
+	startTime = time.time()
+	index = LoadRecordingSnapshot()
+	if index is None:
+		CountCacheEvent("snapshot miss")
+		return None
+	CountCacheEvent("snapshot hit")
+	RecordTiming(PHASE_TIMINGS, "LoadRecordingSnapshot", time.time() - startTime)
+	#Log("CACHING: Using cached tree")
+
+	global RECORDING_INDEX
+	PUBLISH_LOCK.acquire()
+	try:
+		# Never replace what has been fetched from the backends in the meantime:
+		if RECORDING_INDEX is None:
+			RECORDING_INDEX = index
+		return RECORDING_INDEX
+	finally:
+		PUBLISH_LOCK.release()
+
+# Fetches the recordings of a backend - current is what we've got already (or None):
+def FetchBackendRecordings(url, current, full = False):
+	# Try patching the current recordings first (see "Incremental sync" below):
+	if INCREMENTAL_SYNC and not full and not current is None and not current.fullTimestamp is None:
+		if (datetime.datetime.now() - current.fullTimestamp).total_seconds() < FULL_RELOAD_TIME:
+			startTime = time.time()
+			source = None
+			try:
+				source = SyncBackendRecordings(current)
+			except Exception, e:
+				Log("SyncBackendRecordings: sync of %s failed (%s) - loading the full list" % (url, e))
+			RecordTiming(PHASE_TIMINGS, "SyncBackendRecordings", time.time() - startTime)
+			if not source is None:
+				return source
+
+	header, entries = InternalGetRecordedListUnCached(url)
+	timestamp = datetime.datetime.now()
+	return BackendRecordings(url, entries, timestamp, timestamp)
+
+####################################################################################################
+# Recording snapshot:
+# ===================
+# The recording index is saved in the Plex data cache, so that a restarted plugin has something
+# to show right away (while the index is refreshed in the background).
+#
+# The snapshot only holds the ProgramFields values of each recording (everything else in the
+# index is derived from these), stored column by column. Values that repeat across recordings
+# (titles, categories, channels, ...) share a single string object (see InternString), so each
+# is only stored once.
+#
+# The recordings of each backend are saved separately - recordings of backends that are no longer
+# in BACKEND_URLS are ignored.
+#
+# Whenever the snapshot format (or ProgramFields) changes, bump RECORDING_SNAPSHOT_VERSION -
+# snapshots of any other version are ignored.
+####################################################################################################
+
+RECORDING_SNAPSHOT_VERSION = 2
+
+# Saves the current RECORDING_INDEX:
+def SaveRecordingSnapshot():
+	startTime = time.time()
+	SNAPSHOT_LOCK.acquire()
+	try:
+		sources = []
+		for source in RECORDING_INDEX.sources:
+			if source.fullTimestamp is None:
+				continue # nothing fetched yet
+
+			rows = [recording.fields for recording in source.entries]
+			if len(rows) > 0:
+				columns = [list(column) for column in zip(*rows)]
+			else:
+				columns = [[] for xpath in ProgramFields]
+
+			sources.append(
+				{
+					"url": source.url,
+					"timestamp": source.timestamp,
+					"fullTimestamp": source.fullTimestamp,
+					"columns": columns
+				})
+
+		snapshot = \
+			{
+				"version": RECORDING_SNAPSHOT_VERSION,
+				"fields": list(ProgramFields),
+				"sources": sources
+			}
+		Data.SaveObject(RECORDINGS_CACHE_KEY, snapshot)
+	finally:
+		SNAPSHOT_LOCK.release()
+	RecordTiming(PHASE_TIMINGS, "SaveRecordingSnapshot", time.time() - startTime)
+
+def LoadRecordingSnapshot():
+	if Data.Exists(RECORDINGS_CACHE_TIMESTAMP_KEY):
+		Data.Remove(RECORDINGS_CACHE_TIMESTAMP_KEY)
+
+	snapshot = Data.LoadObject(RECORDINGS_CACHE_KEY)
+	if not isinstance(snapshot, dict):
+		return None
+	if snapshot.get("version") != RECORDING_SNAPSHOT_VERSION or snapshot.get("fields") != ProgramFields:
+		return None
+
+	sources = []
+	for saved in snapshot["sources"]:
+		url = saved["url"]
+		if not url in BACKEND_URLS:
+			continue # recordings from a backend we no longer use
+		entries = [RecordingEntry(fields, url) for fields in zip(*saved["columns"])]
+		sources.append(BackendRecordings(url, entries, saved["timestamp"], saved["fullTimestamp"]))
+	if len(sources) == 0:
+		return None
+
+	sources.sort(key = lambda source: BackendOrder(source.url))
+	return RecordingIndex(sources)
+
+# Returns (header, recordings) - see ReadRecordedList:
+# filters is a list of (parameter name, value) filters for the backend to apply (see "Filter
+# pushdown"):
+def InternalGetRecordedListUnCached(backend, maxCount = None, startIndex = None, descending = False, filters = None):
+	url = backend + 'Dvr/GetRecordedList'
+	params = []
+	if descending:
+		params.append("Descending=true")
+	if not startIndex is None:
+		params.append("StartIndex=" + str(startIndex))
+	if not maxCount is None:
+		params.append("Count=" + str(maxCount))
+	for name, value in filters or []:
+		params.append("%s=%s" % (name, urllib.quote(value.encode('utf-8'), safe = '')))
+	if len(params) > 0:
+		url = url + "?" + "&".join(params)
+
+	stream = BackendRequest(url, accept = "application/xml")
+	try:
+		startTime = time.time()
+		result = ReadRecordedList(stream, backend)
+
+		# The time spent waiting for the backend is in BACKEND_STATS - this is the parsing:
+		RecordTiming(PHASE_TIMINGS, "ParseRecordedList", time.time() - startTime - stream.readTime)
+		return result
+	finally:
+		stream.close()
+
+####################################################################################################
+# ReadRecordedList:
+# =================
+# Reads a Dvr/GetRecordedList response from a stream.
+#
+# The response can be tens of megabytes for a large library - so rather than reading the whole
+# thing into a string and parsing that into an element tree, the Program elements are parsed one
+# at a time as they arrive, converted into a RecordingEntry and thrown away.
+#
+# Return:
+#    (header, recordings) tuple, where header is a {string : string} dictionary of the
+#    values preceding the program list (TotalAvailable, Version, etc.)
+####################################################################################################
+def ReadRecordedList(stream, backend):
+	header = {}
+	entries = []
+	programs = None
+	depth = 0
+	for event, element in ET.iterparse(stream, events = ('start', 'end')):
+		if event == 'start':
+			depth = depth + 1
+			if depth == 2 and element.tag == 'Programs':
+				programs = element
+			continue
+
+		depth = depth - 1
+		if depth == 2 and element.tag == 'Program':
+			entries.append(MakeRecordingEntry(element, backend))
+			programs.remove(element)
+		elif depth == 1 and element.tag != 'Programs':
+			header[element.tag] = element.text
+
+	return (header, entries)
+
+####################################################################################################
+# Backend client:
+# ===============
+# All requests to the MythTV backend go through BackendRequest, which
+#    - keeps the connections to each backend open (HTTP keep-alive) and reuses them, rather than
+#      connecting anew for every request
+#    - gives up on backends that don't accept a connection within BACKEND_CONNECT_TIMEOUT
+#      seconds, or stop sending for BACKEND_READ_TIMEOUT seconds - so a hanging backend doesn't
+#      hang the plugin
+#    - retries failed requests up to BACKEND_RETRIES times, waiting BACKEND_RETRY_DELAY seconds
+#      before the first retry, and twice as long before each of the following ones
+#    - counts the requests, failures and time spent per endpoint (see BACKEND_STATS)
+#
+# Requests the backend answers with an error status are only retried if the error is on the
+# backend side (5xx). A request on an idle connection that the backend has closed in the meantime
+# (see IsStaleConnectionError) isn't counted as a failure - it is just sent again.
+####################################################################################################
+
+BACKEND_CONNECT_TIMEOUT = 5
+BACKEND_READ_TIMEOUT = 30
+BACKEND_RETRIES = 2
+BACKEND_RETRY_DELAY = 0.5
+BACKEND_MAX_REDIRECTS = 3
+BACKEND_MAX_IDLE_CONNECTIONS = 4	# per backend
+
+BACKEND_LOCK = Thread.Lock()
+BACKEND_CONNECTIONS = {}	# {(scheme, host:port) : [idle connection]}
+BACKEND_STATS = {}		# {endpoint : BackendStats}
+
+class BackendError(Exception):
+	def __init__(self, url, status, reason):
+		Exception.__init__(self, "%s returned %s %s" % (url, status, reason))
+		self.url = url
+		self.status = status
+
+class BackendStats(object):
+	__slots__ = ('requests', 'failures', 'totalTime', 'maxTime', 'bytes')
+
+	def __init__(self):
+		self.requests = 0
+		self.failures = 0
+		self.totalTime = 0.0	# seconds
+		self.maxTime = 0.0		# seconds
+		self.bytes = 0			# received
+
+# A response from BackendRequest - read it like a file, and close it when done:
+class BackendResponse(object):
+	def __init__(self, backend, connection, response, endpoint, startTime):
+		self.backend = backend
+		self.connection = connection
+		self.response = response
+		self.endpoint = endpoint
+		self.startTime = startTime
+		self.readTime = 0.0		# seconds spent waiting in read
+		self.bytes = 0
+
+	def read(self, size = -1):
+		startTime = time.time()
+		if size < 0:
+			data = self.response.read()
+		else:
+			data = self.response.read(size)
+		self.readTime = self.readTime + time.time() - startTime
+		self.bytes = self.bytes + len(data)
+		return data
+
+	def close(self):
+		if self.connection is None:
+			return
+
+		# The connection can only be reused once the response has been read to the end:
+		if self.response.isclosed() and not self.response.will_close:
+			ReleaseBackendConnection(self.backend, self.connection)
+		else:
+			self.connection.close()
+		self.connection = None
+
+		RecordBackendRequest(self.endpoint, time.time() - self.startTime, False, self.bytes)
+
+def BackendRequest(url, accept = None, redirects = 0):
+	parsedUrl = urlparse.urlparse(url)
+	backend = (parsedUrl.scheme, parsedUrl.netloc)
+	endpoint = parsedUrl.path.strip('/')
+	path = parsedUrl.path
+	if parsedUrl.query:
+		path = path + "?" + parsedUrl.query
+
+	headers = {}
+	if accept:
+		headers['Accept'] = accept
+
+	attempt = 0
+	while True:
+		startTime = time.time()
+		connection = None
+		reused = False
+		try:
+			connection, reused = AcquireBackendConnection(backend)
+			connection.request('GET', path, headers = headers)
+			response = connection.getresponse()
+		except (httplib.HTTPException, socket.error), e:
+			if not connection is None:
+				connection.close()
+			if reused and IsStaleConnectionError(e):
+				continue # the backend has closed the idle connection - just try another one
+			error = e
+		else:
+			if response.status < 300:
+				return BackendResponse(backend, connection, response, endpoint, startTime)
+
+			response.read()
+			if response.will_close:
+				connection.close()
+			else:
+				ReleaseBackendConnection(backend, connection)
+
+			location = response.getheader('Location')
+			if response.status < 400 and location and redirects < BACKEND_MAX_REDIRECTS:
+				RecordBackendRequest(endpoint, time.time() - startTime, False)
+				return BackendRequest(urlparse.urljoin(url, location), accept, redirects + 1)
+
+			error = BackendError(url, response.status, response.reason)
+			if response.status < 500:
+				RecordBackendRequest(endpoint, time.time() - startTime, True)
+				raise error
+
+		RecordBackendRequest(endpoint, time.time() - startTime, True)
+		if attempt >= BACKEND_RETRIES:
+			raise error
+		Log("BackendRequest: %s failed (%s) - retrying" % (url, error))
+		time.sleep(BACKEND_RETRY_DELAY * 2 ** attempt)
+		attempt = attempt + 1
+
+# Whether the error means that the backend had closed the connection before we sent the request
+# (rather than it failing to answer it):
+def IsStaleConnectionError(e):
+	if isinstance(e, httplib.BadStatusLine):
+		return True # nothing was received
+	if isinstance(e, socket.timeout):
+		return False
+	return isinstance(e, socket.error) and e.errno in (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+# Returns (connection, reused) - an idle connection if there is one, otherwise a new one:
+def AcquireBackendConnection(backend):
+	BACKEND_LOCK.acquire()
+	try:
+		idle = BACKEND_CONNECTIONS.get(backend)
+		if idle:
+			return (idle.pop(), True)
+	finally:
+		BACKEND_LOCK.release()
+
+	scheme, netloc = backend
+	if scheme == 'https':
+		connection = httplib.HTTPSConnection(netloc, timeout = BACKEND_CONNECT_TIMEOUT)
+	else:
+		connection = httplib.HTTPConnection(netloc, timeout = BACKEND_CONNECT_TIMEOUT)
+	connection.connect()
+	connection.sock.settimeout(BACKEND_READ_TIMEOUT)
+	return (connection, False)
+
+def ReleaseBackendConnection(backend, connection):
+	BACKEND_LOCK.acquire()
+	try:
+		idle = BACKEND_CONNECTIONS.setdefault(backend, [])
+		if len(idle) < BACKEND_MAX_IDLE_CONNECTIONS:
+			idle.append(connection)
+			return
+	finally:
+		BACKEND_LOCK.release()
+	connection.close()
+
+def RecordBackendRequest(endpoint, seconds, failed, bytes = 0):
+	BACKEND_LOCK.acquire()
+	try:
+		stats = BACKEND_STATS.get(endpoint)
+		if stats is None:
+			stats = BACKEND_STATS[endpoint] = BackendStats()
+		stats.requests = stats.requests + 1
+		if failed:
+			stats.failures = stats.failures + 1
+		stats.totalTime = stats.totalTime + seconds
+		stats.maxTime = max(stats.maxTime, seconds)
+		stats.bytes = stats.bytes + bytes
+	finally:
+		BACKEND_LOCK.release()
+
+####################################################################################################
+# Incremental sync:
+# =================
+# Most of the time, nothing (or very little) has changed since the recorded list was last fetched
+# - so instead of fetching (and parsing) the whole list again, SyncBackendRecordings patches the
+# recordings we've got from the backend, using the paging (StartIndex/Count, newest first) supported by
+# Dvr/GetRecordedList:
+#
+#  1. A probe fetches just the newest recording. If it and the total count are unchanged - and
+#     nothing is still recording - the index is still good.
+#  2. Otherwise, the newest recordings are fetched a page at a time, until we get to a recording
+#     we already have (and which has finished recording, so it can't have changed). These
+#     replace the corresponding part of the list.
+#  3. If the count still doesn't match, recordings further down the list have been deleted.
+#     Each of these is located by a binary search, fetching one recording at a time.
+#
+# Recordings are identified by Channel/ChanId + Recording/StartTs (see RecordingEntry.id).
+#
+# Changes to old recordings (say, moving a recording to another recording group) can't be seen
+# this way - so the list is fetched in full every FULL_RELOAD_TIME seconds anyway. Whenever
+# the sync gets confused, it gives up (returns None), and the list is fetched in full.
+####################################################################################################
+
+SYNC_PAGE_SIZE = 50
+MAX_SYNC_DELETIONS = 5
+
+def SyncBackendRecordings(source):
+	backend = source.url
+	timestamp = datetime.datetime.now()
+	utcnow = datetime.datetime.utcnow()
+
+	# Probe:
+	total, newest = FetchRecordedListPage(backend, 0, 1)
+	newestId = None
+	if len(newest) > 0:
+		newestId = newest[0].id
+	if total == len(source.entries) and newestId == source.NewestId() and not source.HasActiveRecordings(utcnow):
+		#Log("SyncBackendRecordings: no changes")
+		return source.Restamp(timestamp)
+
+	# Fetch the newest recordings:
+	positions = dict((recording.id, position) for position, recording in enumerate(source.entries))
+	head = [] # newest first
+	anchor = None
+	while anchor is None and len(head) < total:
+		if len(head) > total / 2:
+			return None # a full reload is cheaper
+		pageTotal, page = FetchRecordedListPage(backend, len(head), SYNC_PAGE_SIZE)
+		if pageTotal != total or len(page) == 0:
+			return None # the list changed while we were looking
+		for recording in page:
+			head.append(recording)
+			position = positions.get(recording.id)
+			if not position is None and not StillRecording(source.entries[position], utcnow):
+				anchor = position
+				break
+
+	head.reverse()
+	if anchor is None:
+		entries = head
+	else:
+		entries = source.entries[:anchor] + head
+
+	# Find recordings deleted further down the list:
+	deletions = len(entries) - total
+	if deletions > MAX_SYNC_DELETIONS:
+		return None
+	while len(entries) > total:
+		position = FindDeletedRecording(backend, entries, total, len(head))
+		if position is None:
+			return None
+		del entries[position]
+
+	if len(entries) != total or len(set(recording.id for recording in entries)) != total:
+		return None
+
+	# Double-check with the oldest recording:
+	if total > 0:
+		pageTotal, oldest = FetchRecordedListPage(backend, total - 1, 1)
+		if pageTotal != total or len(oldest) != 1 or oldest[0].id != entries[0].id:
+			return None
+
+	Log("SyncBackendRecordings: %s: %s new or updated, %s deleted" % (backend, len(head), deletions))
+	return BackendRecordings(backend, entries, timestamp, source.fullTimestamp)
+
+# Binary search for the first (newest) recording in entries that MythTV no longer has.
+#
+# Positions are counted newest first (as in FetchRecordedListPage) - but the position
+# returned is an index into entries (which is oldest first).
+def FindDeletedRecording(backend, entries, total, start):
+	low = start
+	high = total
+	while low < high:
+		middle = (low + high) / 2
+		pageTotal, page = FetchRecordedListPage(backend, middle, 1)
+		if pageTotal != total or len(page) != 1:
+			return None
+		if page[0].id == entries[len(entries) - 1 - middle].id:
+			low = middle + 1
+		else:
+			high = middle
+	return len(entries) - 1 - low
+
+# Returns (TotalAvailable, recordings) for a page of the recorded list, newest first:
+def FetchRecordedListPage(backend, startIndex, count):
+	header, entries = InternalGetRecordedListUnCached(backend, count, startIndex, descending = True)
+	return (int(header['TotalAvailable']), entries)
+
+####################################################################################################
+# Filter pushdown:
+# ================
+# Without a servable recording index (on a cold start, when the index is too old to serve, or
+# with the data cache switched off), a request has to wait for the full recorded list of every
+# backend - tens of megabytes of XML for a large library - even when it is a deep link into a
+# single title, or a "Play" from the Plex history, that only needs a handful of recordings.
+#
+# So in that case, the filters the backend can apply itself (see PUSHDOWN_FILTERS) are passed on
+# to Dvr/GetRecordedList, and the request is served from a small index of just the recordings
+# returned - while the full index is refreshed in the background, for the requests that follow.
+# A single recording (RecordingInfo) is simply fetched with Dvr/GetRecorded.
+#
+# The backend filters select a superset of the recordings matching filterBy (TitleRegEx is
+# matched against the titles before unmangling, ignoring case) - the recordings are filtered
+# again here, as always. Backends older than MythTV 0.28 ignore the filters, and return every
+# recording: once a backend has done that, filters are no longer pushed down.
+#
+# With DETECT_SERIES_BY_TITLE, a series may hold recordings of quite different titles, that share
+# an inetref (see "Series clusters") - the backend can't tell which. So the title filter asks for
+# the titles the series had in the last recording index (see SeriesRegEx) - or isn't pushed down,
+# if there are more than PUSHDOWN_MAX_TITLES of them. Without a recording index (on the first
+# start), it only asks for titles like the series title: if the recordings returned have an
+# inetref that other titles may share, the pushdown is abandoned (see CompletePushdown).
+####################################################################################################
+
+# {filter key : Dvr/GetRecordedList parameter} - the filter keys are also the ProgramFields of
+# the values the backend filters on:
+PUSHDOWN_FILTERS = \
+	{
+		"Title": "TitleRegEx",
+		"Recording/RecGroup": "RecGroup",
+		"Recording/StorageGroup": "StorageGroup"
+	}
+
+PUSHDOWN_CACHE_SIZE = 20
+PUSHDOWN_MAX_TITLES = 10
+
+PUSHDOWN_LOCK = Thread.Lock()
+PUSHDOWN_INDEXES = collections.OrderedDict()	# {filters : RecordingIndex}, least recently used first
+PUSHDOWN_IGNORED = set()	# URLs of the backends that ignored the filters
+
+# Returns a recording index holding (at least) the recordings matching filterBy:
+def GetRecordingIndexFor(filterBy):
 	if USE_DATA_CACHE:
-		cachedRoot = Data.LoadObject(RECORDINGS_CACHE_KEY)
-		cachedRootTime = Data.LoadObject(RECORDINGS_CACHE_TIMESTAMP_KEY)
-		now = datetime.datetime.now()
-		if cachedRoot and cachedRootTime:
-			if (now - cachedRootTime).total_seconds() < DATA_CACHE_TIME:
-				#Log("CACHING: Using cached tree")
-				return cachedRoot
-			#Log("CACHING: Cached tree expired - loading from server")
+		index = ServableRecordingIndex()
+		if not index is None:
+			return index
 
-	root = InternalGetRecordedListUnCached()
+	filters = PushdownFilters(filterBy)
+	if len(filters) == 0 or len(PUSHDOWN_IGNORED) > 0:
+		return InternalGetRecordedList()
 
+	index = FetchPushdownIndex(filters)
+	if index is None or not CompletePushdown(index, filterBy):
+		return InternalGetRecordedList()
+
+	# (started only now, so it doesn't hold up the backend's answer above)
 	if USE_DATA_CACHE:
-		#Log("CACHING: Saving cached tree")
-		Data.SaveObject(RECORDINGS_CACHE_KEY, root)
-		Data.SaveObject(RECORDINGS_CACHE_TIMESTAMP_KEY, datetime.datetime.now())
+		RefreshRecordingIndex(wait = False)
+	return index
 
-	return root
+# Returns the recording - from the recording index, if it can be served, or else straight from
+# the backend:
+def FindRecording(chanId, startTime):
+	index = None
+	if USE_DATA_CACHE:
+		index = ServableRecordingIndex()
 
-def InternalGetRecordedListUnCached(maxCount = None):
-	url = PVR_URL + 'Dvr/GetRecordedList'
-	if not maxCount is None:
-		url = url + "?Count=" + str(maxCount)
-	xmlstring = HTTP.Request(url, cacheTime = CACHE_TIME).content
-	root = ET.fromstring(xmlstring)
-	return root
+	recording = None
+	if not index is None:
+		recording = index.Lookup(MakeRecordingId(chanId, startTime))
+	if recording is None:
+		recording = InternalGetRecordedUnCached(chanId, startTime)
+
+	if USE_DATA_CACHE and index is None:
+		RefreshRecordingIndex(wait = False)
+	return recording
+
+# Returns the (filter key, parameter name, value) filters for the backend, selecting a superset
+# of the recordings matching filterBy:
+def PushdownFilters(filterBy):
+	filters = []
+	for key, value in filterBy.items():
+		name = PUSHDOWN_FILTERS.get(key)
+		if name is None or not value:
+			continue
+		if key == "Title":
+			value = SeriesRegEx(value)
+			if value is None:
+				continue
+		filters.append((key, name, value))
+	return tuple(sorted(filters))
+
+# Returns the SeriesCluster of the series title in the recording index (None if we don't know it):
+def KnownSeries(title):
+	index = RECORDING_INDEX
+	if not DETECT_SERIES_BY_TITLE or index is None:
+		return None
+	return index.Series(title)
+
+# Returns a regular expression matching the titles of the series (as far as we know them) - or
+# None, if there are too many of them:
+def SeriesRegEx(title):
+	titles = [title]
+	cluster = KnownSeries(title)
+	if not cluster is None:
+		titles = cluster.titles
+
+	patterns = sorted(set(TitleRegEx(title) for title in titles))
+	if len(patterns) == 1:
+		return patterns[0]
+	if len(patterns) > PUSHDOWN_MAX_TITLES:
+		return None
+	return u"|".join(u"(?:%s)" % pattern for pattern in patterns)
+
+# Whether the pushdown index holds all the recordings of the series filterBy asks for - it does,
+# unless the titles of the series weren't known (see SeriesRegEx), and other titles may join it:
+def CompletePushdown(index, filterBy):
+	title = filterBy.get("Title")
+	if not title or not DETECT_SERIES_BY_TITLE or not KnownSeries(title) is None:
+		return True
+
+	cluster = index.Series(title)
+	if not cluster is None and not cluster.byInetref:
+		return True
+	CountCacheEvent("pushdown incomplete")
+	return False
+
+# Returns a regular expression matching the titles that unmangle into title (see UnmangleTitle) -
+# or, when detecting series, into titles with the same words (see SeriesKey):
+def TitleRegEx(title):
+	end = "$"
+	if UNMANGLE_TITLES:
+		end = "(" + "|".join(RegExEscape(splitter) for splitter in TITLE_RULES.splitters) + "|$)"
+
+	words = SearchTokens(title)
+	if DETECT_SERIES_BY_TITLE and len(words) > 0:
+		if len(words) > 1 and words[0] in SERIES_ARTICLES:
+			words = words[1:]
+		articles = u"((" + u"|".join(SERIES_ARTICLES) + u")\\W+)?"
+		return u"^\\W*" + articles + u"\\W+".join(AccentedRegEx(word) for word in words) + u"\\W*" + end
+
+	if not UNMANGLE_TITLES:
+		return "^" + RegExEscape(title) + "$"
+	return "^\\s*" + RegExEscape(title) + "\\s*" + end
+
+def RegExEscape(text):
+	return re.sub(r'([\\^$.|?*+()\[\]{}])', r'\\\1', text)
+
+# Returns {unaccented letter : character class matching it, and its accented versions} - for the
+# letters of Latin-1 and Latin Extended-A:
+def AccentedLetters():
+	versions = {}
+	for code in range(0xC0, 0x180):
+		letter = unichr(code).lower()
+		base = u''.join(c for c in unicodedata.normalize('NFKD', letter) if not unicodedata.combining(c))
+		if len(base) == 1 and base != letter:
+			versions.setdefault(base, set()).add(letter)
+	return dict((base, u"[" + base + u"".join(sorted(letters)) + u"]") for base, letters in versions.items())
+
+ACCENTED_LETTERS = AccentedLetters()
+
+# Returns a regular expression matching the (unaccented) word, accented or not (see SearchTokens):
+def AccentedRegEx(word):
+	return u"".join(ACCENTED_LETTERS.get(c) or RegExEscape(c) for c in word)
+
+# Fetches the recordings selected by filters from each backend, and returns an index of them - or
+# None, if no backend could deliver them:
+def FetchPushdownIndex(filters):
+	now = datetime.datetime.now()
+	PUSHDOWN_LOCK.acquire()
+	try:
+		index = PUSHDOWN_INDEXES.pop(filters, None)
+		if not index is None and (now - index.timestamp).total_seconds() < DATA_CACHE_TIME:
+			PUSHDOWN_INDEXES[filters] = index
+			CountCacheEvent("pushdown hit")
+			return index
+	finally:
+		PUSHDOWN_LOCK.release()
+
+	CountCacheEvent("pushdown miss")
+	startTime = time.time()
+	sources = []
+	for url in BACKEND_URLS:
+		try:
+			header, entries = InternalGetRecordedListUnCached(url, filters = [(name, value) for key, name, value in filters])
+		except Exception, e:
+			Log("FetchPushdownIndex: %s failed (%s)" % (url, e))
+			continue
+
+		for recording in entries:
+			if not MatchPushdownFilters(filters, recording):
+				Log("FetchPushdownIndex: %s ignores the filters - no longer pushing them down" % url)
+				PUSHDOWN_IGNORED.add(url)
+				return None
+		sources.append(BackendRecordings(url, entries, now, now))
+	if len(sources) == 0:
+		return None
+
+	index = RecordingIndex(sources)
+	RecordTiming(PHASE_TIMINGS, "FetchPushdownIndex", time.time() - startTime)
+
+	PUSHDOWN_LOCK.acquire()
+	try:
+		PUSHDOWN_INDEXES[filters] = index
+		while len(PUSHDOWN_INDEXES) > PUSHDOWN_CACHE_SIZE:
+			PUSHDOWN_INDEXES.popitem(last = False)
+	finally:
+		PUSHDOWN_LOCK.release()
+	return index
+
+# Checks that the backend applied the filters to the recording (using the values it got from the
+# backend, before unmangling and aliasing):
+def MatchPushdownFilters(filters, recording):
+	for key, name, value in filters:
+		actualValue = recording.fields[ProgramFields.index(key)] or ""
+		if name == "TitleRegEx":
+			if not re.search(value, actualValue, re.IGNORECASE | re.UNICODE):
+				return False
+		elif actualValue != value:
+			return False
+	return True
+
+####################################################################################################
+# Backend events:
+# ===============
+# With LISTEN_FOR_EVENTS set, changes to the recordings show up within seconds, rather than when
+# the recording index expires - so DATA_CACHE_TIME can be raised to hours.
+#
+# For each backend, a listener thread connects to the MythTV backend protocol (EVENT_PORT),
+# announces itself as a monitor, and passes the RECORDING_LIST_CHANGE events it gets on to the
+# event applier thread (via EVENT_QUEUE). The applier collects the events for EVENT_BATCH_DELAY
+# seconds (a recording often comes with a burst of them), and then updates the recordings of
+# the backend:
+#    - RECORDING_LIST_CHANGE ADD <chanid> <starttime>: the recording is fetched, and added
+#    - RECORDING_LIST_CHANGE DELETE <chanid> <starttime>: the recording is removed
+#    - RECORDING_LIST_CHANGE UPDATE <program>: the recording is fetched again. The layout of
+#      the program fields differs between protocol versions, so the recording is recognised by
+#      its file name - if it isn't one we know, the recordings are synced instead
+#    - RECORDING_LIST_CHANGE (anything else): the full list is fetched again
+#
+# Events may have been missed while the listener wasn't connected, so the recordings are synced
+# whenever it (re)connects.
+####################################################################################################
+
+LISTEN_FOR_EVENTS = False
+EVENT_PORT = 6543
+EVENT_BATCH_DELAY = 2			# seconds
+EVENT_RECONNECT_DELAY = 30		# seconds
+EVENT_CLIENT_NAME = "MythRecordings"
+
+# The protocol version we speak first, and the tokens of the ones we can switch to when the
+# backend wants another one:
+PROTOCOL_VERSION = 77
+PROTOCOL_TOKENS = {77: "WindMark", 88: "XmasGift", 91: "BuzzOff"}
+PROTOCOL_SEPARATOR = u"[]:[]"
+
+EVENT_LOCK = Thread.Lock()
+EVENT_GENERATION = 0		# bumped whenever the listeners are restarted - the old ones quit
+EVENT_SOCKETS = {}			# {backend URL : socket of its listener}
+EVENT_QUEUE = Queue.Queue()	# (backend URL, event) - event None meaning "sync"
+EVENT_APPLIER_STARTED = False
+
+# (Re)starts the listeners - called whenever the preferences change:
+def StartEventListeners():
+	global EVENT_GENERATION, EVENT_APPLIER_STARTED
+
+	EVENT_LOCK.acquire()
+	try:
+		EVENT_GENERATION = EVENT_GENERATION + 1
+		for eventSocket in EVENT_SOCKETS.values():
+			CloseEventSocket(eventSocket)
+		EVENT_SOCKETS.clear()
+
+		if not LISTEN_FOR_EVENTS:
+			return
+		if not EVENT_APPLIER_STARTED:
+			Thread.Create(EventApplier)
+			EVENT_APPLIER_STARTED = True
+		for url in BACKEND_URLS:
+			Thread.Create(EventListener, backend = url, generation = EVENT_GENERATION)
+	finally:
+		EVENT_LOCK.release()
+
+def EventListener(backend, generation):
+	host = urlparse.urlparse(backend).hostname
+	while generation == EVENT_GENERATION:
+		eventSocket = None
+		try:
+			eventSocket = ConnectEventSocket(host, EVENT_PORT)
+			if not RegisterEventSocket(backend, generation, eventSocket):
+				break
+			Log("EventListener: listening to %s:%s" % (host, EVENT_PORT))
+			EVENT_QUEUE.put((backend, None))
+
+			while True:
+				message = ReadProtocolMessage(eventSocket)
+				if len(message) >= 2 and message[0] == "BACKEND_MESSAGE" and message[1].startswith("RECORDING_LIST_CHANGE"):
+					EVENT_QUEUE.put((backend, message[1:]))
+		except Exception, e:
+			if generation == EVENT_GENERATION:
+				Log("EventListener: %s:%s: %s - reconnecting in %s seconds" % (host, EVENT_PORT, e, EVENT_RECONNECT_DELAY))
+		finally:
+			if not eventSocket is None:
+				CloseEventSocket(eventSocket)
+
+		if generation == EVENT_GENERATION:
+			time.sleep(EVENT_RECONNECT_DELAY)
+
+def RegisterEventSocket(backend, generation, eventSocket):
+	EVENT_LOCK.acquire()
+	try:
+		if generation != EVENT_GENERATION:
+			return False # the listeners have been restarted while we were connecting
+		EVENT_SOCKETS[backend] = eventSocket
+		return True
+	finally:
+		EVENT_LOCK.release()
+
+def CloseEventSocket(eventSocket):
+	try:
+		eventSocket.shutdown(socket.SHUT_RDWR)
+	except socket.error:
+		pass
+	eventSocket.close()
+
+# Connects to the backend protocol, and announces us as a monitor wanting the events:
+def ConnectEventSocket(host, port):
+	version = PROTOCOL_VERSION
+	while True:
+		eventSocket = socket.create_connection((host, port), BACKEND_CONNECT_TIMEOUT)
+		try:
+			SendProtocolMessage(eventSocket, u"MYTH_PROTO_VERSION %s %s" % (version, PROTOCOL_TOKENS[version]))
+			reply = ReadProtocolMessage(eventSocket)
+			if reply[0] == "ACCEPT":
+				break
+
+			# REJECT[]:[]<the backend's version>:
+			backendVersion = None
+			if len(reply) > 1 and reply[1].isdigit():
+				backendVersion = int(reply[1])
+			if backendVersion == version or not backendVersion in PROTOCOL_TOKENS:
+				raise Exception("the backend speaks protocol version %s" % backendVersion)
+			version = backendVersion
+		except:
+			CloseEventSocket(eventSocket)
+			raise
+		CloseEventSocket(eventSocket)
+
+	SendProtocolMessage(eventSocket, u"ANN Monitor %s 1" % EVENT_CLIENT_NAME)
+	reply = ReadProtocolMessage(eventSocket)
+	if reply[0] != "OK":
+		CloseEventSocket(eventSocket)
+		raise Exception("the backend refused us as a monitor: %s" % reply)
+
+	# Events may be hours apart - block until they come (but notice a dead backend):
+	eventSocket.settimeout(None)
+	eventSocket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+	return eventSocket
+
+# Backend protocol messages are the length (8 characters, space padded) followed by the
+# fields, separated by PROTOCOL_SEPARATOR:
+def SendProtocolMessage(eventSocket, text):
+	data = text.encode('utf-8')
+	eventSocket.sendall("%-8d%s" % (len(data), data))
+
+def ReadProtocolMessage(eventSocket):
+	length = int(ReadFromSocket(eventSocket, 8).strip())
+	return ReadFromSocket(eventSocket, length).decode('utf-8', 'replace').split(PROTOCOL_SEPARATOR)
+
+def ReadFromSocket(eventSocket, size):
+	chunks = []
+	while size > 0:
+		chunk = eventSocket.recv(size)
+		if not chunk:
+			raise socket.error("connection closed")
+		chunks.append(chunk)
+		size = size - len(chunk)
+	return "".join(chunks)
+
+def EventApplier():
+	while True:
+		batch = [EVENT_QUEUE.get()]
+		time.sleep(EVENT_BATCH_DELAY)
+		try:
+			while True:
+				batch.append(EVENT_QUEUE.get_nowait())
+		except Queue.Empty:
+			pass
+
+		events = collections.OrderedDict()	# {backend URL : [event]}
+		for backend, event in batch:
+			events.setdefault(backend, []).append(event)
+		for backend, backendEvents in events.items():
+			if not backend in BACKEND_URLS:
+				continue
+			try:
+				ApplyBackendEvents(backend, backendEvents)
+			except Exception, e:
+				Log("EventApplier: could not apply the events from %s (%s) - syncing" % (backend, e))
+				RefreshBackend(backend)
+
+def ApplyBackendEvents(backend, events):
+	index = RECORDING_INDEX
+	source = None
+	if not index is None:
+		source = index.Source(backend)
+	if source is None or source.fullTimestamp is None:
+		return # nothing fetched yet - the first refresh will get everything
+
+	fetch = collections.OrderedDict()	# {recording ID : (chanId, startTime)} to (re)fetch
+	delete = set()						# recording IDs
+	refresh = None						# None, "sync" or "full"
+	fileNames = None
+	for event in events:
+		if event is None:
+			refresh = refresh or "sync"
+			continue
+
+		words = event[0].split()
+		action = None
+		if len(words) > 1:
+			action = words[1]
+		CountCacheEvent("event %s" % (action or "change").lower())
+
+		if action in ("ADD", "DELETE") and len(words) >= 4:
+			chanId = words[2]
+			startTime = words[3]
+			if not startTime.endswith('Z'):
+				startTime = startTime + 'Z' # UTC, like the services API
+			recordingId = MakeRecordingId(chanId, startTime)
+			if action == "ADD":
+				fetch[recordingId] = (chanId, startTime)
+				delete.discard(recordingId)
+			else:
+				fetch.pop(recordingId, None)
+				delete.add(recordingId)
+		elif action == "UPDATE":
+			if fileNames is None:
+				fileNames = dict((recording.fileName, recording) for recording in source.entries)
+			recording = None
+			for field in event[1:]:
+				recording = fileNames.get(field.rsplit('/', 1)[-1])
+				if not recording is None:
+					break
+			if recording is None:
+				refresh = refresh or "sync"
+			else:
+				fetch[recording.id] = (recording.chanId, recording.recordingStart)
+		else:
+			refresh = "full"
+
+	# A refresh takes care of everything:
+	if not refresh is None:
+		RefreshBackend(backend, full = (refresh == "full"))
+		return
+
+	# A refresh in flight may have fetched the list before these changes - and would replace the
+	# patched list with it when done. So we leave the changes to another refresh following it:
+	REFRESH_LOCK.acquire()
+	try:
+		inFlight = backend in REFRESH_FLIGHTS
+	finally:
+		REFRESH_LOCK.release()
+	if inFlight:
+		RefreshBackend(backend)
+		return
+
+	fetched = []
+	for recordingId, (chanId, startTime) in fetch.items():
+		try:
+			fetched.append(FetchRecording(backend, chanId, startTime))
+		except BackendError, e:
+			if e.status >= 500:
+				raise
+			delete.add(recordingId) # gone again already
+
+	changed = delete.union(fetch.keys())
+	entries = [recording for recording in source.entries if not recording.id in changed]
+	for recording in fetched:
+		# Keep the order of Dvr/GetRecordedList (by start time), which the sync relies on:
+		startTimes = [entry.recordingStart for entry in entries]
+		entries.insert(bisect.bisect_right(startTimes, recording.recordingStart), recording)
+
+	Log("ApplyBackendEvents: %s: %s added or updated, %s deleted" % (backend, len(fetched), len(delete)))
+	patched = BackendRecordings(backend, entries, source.timestamp, source.fullTimestamp)
+	if PublishBackendRecordings(patched, replacing = source) is None:
+		# (a refresh completed in the meantime - with a list fetched before the changes, maybe)
+		RefreshBackend(backend)
+		return
+	if USE_DATA_CACHE:
+		SaveRecordingSnapshot()
 
 def Match(filterBy, recording):
 	for filterKeyName, filterKeyValue in filterBy.items():
@@ -827,84 +3042,853 @@ def Match(filterBy, recording):
 def identify_recording(recording):
 	if recording is None:
 		return "None"
-	chanId = GetField(recording, 'Channel/ChanId')
-	programStart = GetField(recording, 'Recording/StartTs')
-	return "%s/%s" % (chanId, programStart)
-	
+	return recording.id
+
+def MakeRecordingId(chanId, recordingStart):
+	return "%s/%s" % (chanId, recordingStart)
+
+####################################################################################################
+# Recording index:
+# ================
+# Looking up values in the XML returned by MythTV (and unmangling titles, aliasing categories and
+# parsing dates on every lookup) is far too slow to do on every click when the backend holds
+# thousands of recordings.
+#
+# So whenever the recorded list is fetched, each Program element is converted - once - into a
+# RecordingEntry holding the values the plugin uses, with all the derived values (unmangled
+# title/subtitle, aliased category, parsed dates, playback URLs) already computed.
+#
+# BackendRecordings holds the entries of the recorded list of one backend, and RecordingIndex
+# merges those of all the backends. The index is kept in memory until the data cache expires.
+####################################################################################################
+
+# RecordingFields:
+# ================
+# Maps the XPATH key names used for filtering, grouping and sorting (see ReadableKeyNames above)
+# to the RecordingEntry attribute holding the value.
+#
+# So: whenever you want to filter, group or sort by a new key, add it to the dictionary below
+# (and to RecordingEntry).
+
+RecordingFields = \
+	{
+		"Title": "seriesTitle",	# see "Series clusters" - the title itself is only displayed
+		"SubTitle": "subTitle",
+		"Category": "category",
+		"Description": "description",
+		"Inetref": "inetref",
+		"FileName": "fileName",
+		"FileSize": "fileSize",
+		"StartTime": "programStart",
+		"EndTime": "programEnd",
+		"Channel/ChanId": "chanId",
+		"Channel/ChannelName": "channelName",
+		"Recording/RecGroup": "recGroup",
+		"Recording/StorageGroup": "storageGroup",
+		"Recording/StartTs": "recordingStart",
+		"Recording/EndTs": "recordingEnd"
+	}
+
+# ProgramFields:
+# ==============
+# The XPATH expressions of the values read from each Program element, in the order they are kept
+# in RecordingEntry.fields. Everything else in a RecordingEntry is derived from these.
+
+ProgramFields = \
+	[
+		'Title', 'SubTitle', 'Category', 'Description', 'Inetref', 'FileName', 'FileSize',
+		'StartTime', 'EndTime', 'Channel/ChanId', 'Channel/ChannelName',
+		'Recording/RecGroup', 'Recording/StorageGroup', 'Recording/StartTs', 'Recording/EndTs'
+	]
+
+class RecordingEntry(object):
+	__slots__ = (
+		'fields', 'id', 'backend',
+		'title', 'subTitle', 'category', 'description', 'inetref', 'seriesTitle', 'seriesInetref',
+		'fileName', 'fileSize', 'programStart', 'programEnd',
+		'chanId', 'channelName', 'recGroup', 'storageGroup', 'recordingStart', 'recordingEnd',
+		'shouldStart', 'shouldEnd', 'didStart', 'didEnd',
+		'recordedDuration', 'scheduledDuration', 'missedAtStart', 'missedAtEnd',
+		'streamUrl', 'fileUrl', 'previewUrl',
+		'hidden', 'rules'
+		)
+
+	# fields is a tuple of the ProgramFields values, backend the URL of the backend holding it:
+	def __init__(self, fields, backend):
+		self.fields = fields
+		self.backend = backend
+		(rawTitle, rawSubTitle, rawCategory, self.description, self.inetref, self.fileName, self.fileSize,
+			self.programStart, self.programEnd, self.chanId, self.channelName,
+			self.recGroup, self.storageGroup, self.recordingStart, self.recordingEnd) = fields
+
+		self.ApplyRules(TITLE_RULES)
+
+		self.id = MakeRecordingId(self.chanId, self.recordingStart)
+
+		self.shouldStart = ParseTimestamp(self.programStart)
+		self.shouldEnd = ParseTimestamp(self.programEnd)
+		self.didStart = ParseTimestamp(self.recordingStart)
+		self.didEnd = ParseTimestamp(self.recordingEnd)
+
+		# Timing metrics (see Recording) - None when a timestamp is missing:
+		self.recordedDuration = TimeDifference(self.didEnd, self.didStart)
+		self.scheduledDuration = TimeDifference(self.shouldEnd, self.didStart)
+		if not self.scheduledDuration is None:
+			self.scheduledDuration = self.scheduledDuration + datetime.timedelta(hours=0, minutes=5,seconds=0)
+		self.missedAtStart = TimeDifference(self.didStart, self.shouldStart)
+		self.missedAtEnd = TimeDifference(self.shouldEnd, self.didEnd)
+
+		# Playback URLs (see Recording for which one is used):
+		self.streamUrl = backend + 'Content/GetRecording?ChanId=%s&StartTime=%s' % (self.chanId, self.recordingStart,)
+		self.fileUrl = backend + 'Content/GetFile?StorageGroup=%s&FileName=%s' % (self.storageGroup, self.fileName,)
+
+		# Screenshot URL:
+		if self.chanId is None or self.chanId == '0' or self.recordingStart is None:
+			self.previewUrl = None
+		else:
+			self.previewUrl = backend + '/Content/GetPreviewImage?ChanId=%s&StartTime=%s' % (self.chanId, self.recordingStart)
+			if SCREENSHOT_ICON_HEIGHT:
+				self.previewUrl = self.previewUrl + "&Height=%s" % SCREENSHOT_ICON_HEIGHT
+			if SCREENSHOT_ICON_WIDTH:
+				self.previewUrl = self.previewUrl + "&Width=%s" % SCREENSHOT_ICON_WIDTH
+
+		# Recordings that should never be listed:
+		self.hidden = \
+			self.recGroup == 'Deleted' or \
+			self.recGroup == 'LiveTV' or \
+			self.fileSize == '0' or \
+			rawTitle == 'Unknown'
+
+	# Derives the title, subtitle and category (see "Title rules"):
+	def ApplyRules(self, rules):
+		rawTitle, rawSubTitle, rawCategory = self.fields[0:3]
+		self.title, self.subTitle = UnmangleTitle(rawTitle, rawSubTitle, rules)
+		self.category = MapAliases(rawCategory, rules.categoryAliases)
+		self.rules = rules
+
+		# (until the recording is clustered into a series - see "Series clusters")
+		self.seriesTitle = self.title
+		self.seriesInetref = self.inetref
+
+	# Returns a copy, derived with other rules:
+	def WithRules(self, rules):
+		entry = copy.copy(self)
+		entry.ApplyRules(rules)
+		return entry
+
+# The recordings of one backend:
+class BackendRecordings(object):
+	__slots__ = ('url', 'entries', 'timestamp', 'fullTimestamp', 'error')
+
+	def __init__(self, url, entries, timestamp, fullTimestamp, error = None):
+		self.url = url
+		self.entries = entries				# all the recordings (hidden or not), in the order returned by MythTV
+		self.timestamp = timestamp			# when the recorded list was last fetched (or synced)
+		self.fullTimestamp = fullTimestamp	# when it was last fetched in full - None if never
+		self.error = error					# why the last refresh failed - None if it didn't
+
+	def NewestId(self):
+		if len(self.entries) == 0:
+			return None
+		return self.entries[-1].id
+
+	def HasActiveRecordings(self, utcnow):
+		for recording in self.entries:
+			if StillRecording(recording, utcnow):
+				return True
+		return False
+
+	def Restamp(self, timestamp):
+		return BackendRecordings(self.url, self.entries, timestamp, self.fullTimestamp)
+
+	def WithEntries(self, entries):
+		if entries is self.entries:
+			return self
+		return BackendRecordings(self.url, entries, self.timestamp, self.fullTimestamp, self.error)
+
+class RecordingIndex(object):
+	# sources is a list of BackendRecordings, in the order of BACKEND_URLS:
+	def __init__(self, sources):
+		startTime = time.time()
+		self.SetSources(sources)
+
+		self.entries = []		# all the recordings (hidden or not): each backend's, in the order returned by MythTV
+		self.recordings = []	# the recordings to list, in the same order
+		self.byId = {}
+		self.inetrefBackends = {}	# {inetref : URL of the (first) backend with recordings of it}
+
+		# The same recording (Channel/ChanId + Recording/StartTs) may be on more than one backend
+		# (say, a master and its slave) - only the first one is used:
+		ids = set()
+		for source in sources:
+			for recording in source.entries:
+				if recording.id in ids:
+					continue
+				ids.add(recording.id)
+				self.entries.append(recording)
+				if recording.hidden:
+					continue
+				self.recordings.append(recording)
+				self.byId[recording.id] = recording
+				if not recording.inetref is None:
+					self.inetrefBackends.setdefault(recording.inetref, source.url)
+
+		# {series title : SeriesCluster} - see "Series clusters" (this also sets the seriesTitle
+		# and seriesInetref of the recordings, so it goes before the group trees):
+		self.series = {}
+		if DETECT_SERIES_BY_TITLE:
+			self.series = ClusterSeries(self.recordings)
+
+			# (some of the recordings are copies now)
+			self.byId = dict((recording.id, recording) for recording in self.recordings)
+			self.entries = [self.byId.get(recording.id, recording) for recording in self.entries]
+
+		self.groupTrees = {}
+		for groupByList in GroupingPaths:
+			self.groupTrees[tuple(groupByList)] = BuildGroupTree(self.recordings, groupByList)
+
+		self.views = collections.OrderedDict()	# {view key : SortedView}, least recently used first
+		self.searchIndex = None	# see "Search index" - built on first use
+
+		RecordTiming(PHASE_TIMINGS, "BuildRecordingIndex", time.time() - startTime)
+
+	def __len__(self):
+		return len(self.recordings)
+
+	def Lookup(self, recordingId):
+		return self.byId.get(recordingId)
+
+	# Returns the SeriesCluster of a series title (None if there is none):
+	def Series(self, title):
+		return self.series.get(title)
+
+	def SetSources(self, sources):
+		self.sources = sources
+
+		# The index is as old as its oldest recorded list:
+		self.timestamp = min(source.timestamp for source in sources)
+		self.fullTimestamp = None
+		for source in sources:
+			if not source.fullTimestamp is None:
+				if self.fullTimestamp is None or source.fullTimestamp < self.fullTimestamp:
+					self.fullTimestamp = source.fullTimestamp
+
+	def Source(self, url):
+		for source in self.sources:
+			if source.url == url:
+				return source
+		return None
+
+	# Returns a copy of the index, with the sources replaced by ones holding the same recordings:
+	def WithSources(self, sources):
+		index = copy.copy(self)
+		index.SetSources(sources)
+		return index
+
+	# Returns a copy of the index, with a new timestamp:
+	def Restamp(self, timestamp):
+		return self.WithSources([source.Restamp(timestamp) for source in self.sources])
+
+	def Members(self, node):
+		return [self.byId[recordingId] for recordingId in node.memberIds]
+
+	# Returns the group tree node holding the recordings matching filterBy, grouped by
+	# groupByList[0]. For groupings that aren't in GroupingPaths, the tree is built (and cached)
+	# on first use:
+	def GroupTree(self, filterBy, groupByList):
+		node = self.FindGroupNode(filterBy, groupByList)
+		if not node is None:
+			return node
+
+		key = ('GroupTree', tuple(sorted(filterBy.items())), groupByList[0])
+		VIEW_LOCK.acquire()
+		try:
+			node = self.views.pop(key, None)
+			if not node is None:
+				self.views[key] = node
+				return node
+		finally:
+			VIEW_LOCK.release()
+
+		node = BuildGroupTree(FilterRecordings(self, filterBy), groupByList[:1])
+
+		VIEW_LOCK.acquire()
+		try:
+			self.views[key] = node
+			while len(self.views) > MAX_SORTED_VIEWS:
+				self.views.popitem(last = False)
+		finally:
+			VIEW_LOCK.release()
+		return node
+
+	# Returns the (cached) SortedView of the recordings matching filterBy:
+	def SortedView(self, filterBy, sortKeyName, sortReverse):
+		key = (tuple(sorted(filterBy.items())), sortKeyName, bool(sortReverse))
+
+		VIEW_LOCK.acquire()
+		try:
+			view = self.views.pop(key, None)
+			if not view is None:
+				self.views[key] = view
+				CountCacheEvent("view hit")
+				return view
+		finally:
+			VIEW_LOCK.release()
+
+		CountCacheEvent("view miss")
+		view = SortedView(FilterRecordings(self, filterBy), sortKeyName, sortReverse)
+
+		VIEW_LOCK.acquire()
+		try:
+			self.views[key] = view
+			while len(self.views) > MAX_SORTED_VIEWS:
+				self.views.popitem(last = False)
+		finally:
+			VIEW_LOCK.release()
+		return view
+
+	# Returns the recordings matching a search query, best matches first. The results are cached
+	# along with the sorted views, for paging through them:
+	def Search(self, query):
+		terms = tuple(sorted(set(SearchTokens(query))))
+		key = ('Search', terms)
+
+		VIEW_LOCK.acquire()
+		try:
+			results = self.views.pop(key, None)
+			if not results is None:
+				self.views[key] = results
+				return results
+		finally:
+			VIEW_LOCK.release()
+
+		results = self.GetSearchIndex().Search(terms)
+
+		VIEW_LOCK.acquire()
+		try:
+			self.views[key] = results
+			while len(self.views) > MAX_SORTED_VIEWS:
+				self.views.popitem(last = False)
+		finally:
+			VIEW_LOCK.release()
+		return results
+
+	def GetSearchIndex(self):
+		global SEARCH_USED
+		SEARCH_USED = True
+
+		SEARCH_LOCK.acquire()
+		try:
+			if self.searchIndex is None:
+				self.searchIndex = SearchIndex(self.recordings)
+			return self.searchIndex
+		finally:
+			SEARCH_LOCK.release()
+
+	# Finds the group tree node holding the recordings matching filterBy, provided that
+	# the filter keys (followed by groupByList, if specified) make up one of the GroupingPaths.
+	# Returns None if there is no such group tree.
+	def FindGroupNode(self, filterBy, groupByList = None):
+		for path in GroupingPaths:
+			depth = len(filterBy)
+			if depth > len(path):
+				continue
+			if sorted(filterBy.keys()) != sorted(path[:depth]):
+				continue
+			if not groupByList is None and list(groupByList) != path[depth:]:
+				continue
+
+			node = self.groupTrees[tuple(path)]
+			for key in path[:depth]:
+				node = node.children.get(filterBy[key])
+				if node is None:
+					return EMPTY_GROUP_NODE
+			return node
+		return None
+
+def MakeRecordingEntry(program, backend):
+	fields = [GetText(program, xpath) for xpath in ProgramFields]
+	for position in INTERNED_FIELD_POSITIONS:
+		fields[position] = InternString(fields[position])
+	return RecordingEntry(tuple(fields), backend)
+
+# Values that repeat across recordings - these are interned, so each distinct value is only
+# held once (in memory, and in the recording snapshot):
+InternedFields = \
+	[
+		'Title', 'Category', 'Inetref', 'Channel/ChanId', 'Channel/ChannelName',
+		'Recording/RecGroup', 'Recording/StorageGroup'
+	]
+INTERNED_FIELD_POSITIONS = [ProgramFields.index(xpath) for xpath in InternedFields]
+INTERNED_STRINGS = {}
+
+def InternString(value):
+	if value is None:
+		return None
+	return INTERNED_STRINGS.setdefault(value, value)
+
+def StillRecording(recording, utcnow):
+	if recording.didEnd is None:
+		return False
+	return utcnow - recording.didEnd < datetime.timedelta(hours=0, minutes=0,seconds=30)
+
+def GetText(element, xpath):
+	child = element.find(xpath)
+	if child is None or child.text is None:
+		return None
+	return child.text.decode()
+
+# Parses the UTC timestamps used by MythTV ("2013-12-24T18:00:00Z").
+#
+# strptime is slow, and the same timestamps turn up again and again (one program's end is the
+# next one's start, and every refresh parses the unchanged recordings again) - so the fixed
+# format is picked apart by hand, and the results are remembered in TIMESTAMP_MEMO.
+TIMESTAMP_MEMO = {}
+TIMESTAMP_MEMO_SIZE = 50000
+
+def ParseTimestamp(timestamp):
+	if timestamp is None:
+		return None
+
+	parsed = TIMESTAMP_MEMO.get(timestamp)
+	if not parsed is None:
+		return parsed
+
+	if len(timestamp) == 20 and timestamp[4] == '-' and timestamp[7] == '-' and timestamp[10] == 'T' and \
+		timestamp[13] == ':' and timestamp[16] == ':' and timestamp[19] == 'Z':
+		parsed = datetime.datetime(
+			int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+			int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+	else:
+		parsed = datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+
+	if len(TIMESTAMP_MEMO) >= TIMESTAMP_MEMO_SIZE:
+		TIMESTAMP_MEMO.clear()
+	TIMESTAMP_MEMO[timestamp] = parsed
+	return parsed
+
+def TimeDifference(later, earlier):
+	if later is None or earlier is None:
+		return None
+	return later - earlier
+
+####################################################################################################
+# Group trees:
+# ============
+# Grouping the recordings by a key means looking at every single recording. To avoid doing that
+# on every click, the recordings are sorted into a tree for each of the groupings offered by
+# MainMenu when the recording index is built.
+#
+# Each node in a tree holds the (sorted) keys of its children, and the IDs of the recordings
+# in it - so opening a folder only costs time proportional to the number of entries in it.
+#
+# Each node also holds the entries to list for it (see GroupEntry), in the order they are
+# listed - so a page of a folder is just a slice of them.
+#
+# So: whenever you add a grouping to MainMenu, you want to add it to GroupingPaths below.
+####################################################################################################
+
+GroupingPaths = \
+	[
+		['Title'],
+		['Category', 'Title'],
+		['Recording/RecGroup'],
+		['Channel/ChannelName']
+	]
+
+class GroupNode(object):
+	__slots__ = ('children', 'childKeys', 'entries', 'count', 'memberIds', 'inetref')
+
+	def __init__(self):
+		self.children = {}
+		self.childKeys = []
+		self.entries = []
+		self.count = 0
+		self.memberIds = []
+		self.inetref = None	# the first series inetref of the recordings in the group (see "Series clusters")
+
+# An entry listed by GroupRecordingsBy: a subdirectory - or, when grouping by title, the
+# recording itself, if it's the only one with that title:
+class GroupEntry(object):
+	__slots__ = ('name', 'node', 'recordingId')
+
+	def __init__(self, name, node, recordingId):
+		self.name = name
+		self.node = node
+		self.recordingId = recordingId	# the recording to list instead of the subdirectory, or None
+
+EMPTY_GROUP_NODE = GroupNode()
+
+def BuildGroupTree(recordings, groupByList):
+	root = GroupNode()
+	for recording in recordings:
+		node = root
+		node.memberIds.append(recording.id)
+		for groupByKey in groupByList:
+			keyValue = GetGroupValue(recording, groupByKey)
+			child = node.children.get(keyValue)
+			if child is None:
+				child = GroupNode()
+				node.children[keyValue] = child
+			child.memberIds.append(recording.id)
+			if child.inetref is None:
+				child.inetref = recording.seriesInetref
+			node = child
+
+	FinishGroupNode(root, groupByList)
+	return root
+
+def FinishGroupNode(node, groupByList):
+	node.count = len(node.memberIds)
+	node.childKeys = sorted(node.children.keys())
+	for childKey in node.childKeys:
+		child = node.children[childKey]
+		recordingId = None
+		if groupByList[0] == "Title" and len(child.memberIds) == 1:
+			recordingId = child.memberIds[0]
+		node.entries.append(GroupEntry(childKey, child, recordingId))
+		FinishGroupNode(child, groupByList[1:])
+
+def GetGroupValue(recording, groupByKey):
+	keyValue = GetField(recording, groupByKey)
+	if keyValue is None:
+		keyValue = ""
+	return keyValue.strip(" \t!?")
+
+####################################################################################################
+# Series clusters:
+# ================
+# The same series is often recorded under more than one title ("The Tonight Show" on one channel,
+# "Tonight Show" on another) - which gave a folder, and a series artwork download, for each.
+#
+# So with DETECT_SERIES_BY_TITLE set, the recordings are clustered into series when the
+# recording index is built: recordings with the same title, ignoring case, accents, punctuation
+# and a leading article (see SeriesKey), belong to the same series - and so do titles whose
+# recordings mostly have the same inetref. Each series gets
+#    - a canonical title: the most common title of its recordings. This is the recordings'
+#      seriesTitle - the "Title" they are grouped, filtered and sorted by
+#    - a representative inetref: the most common inetref of its recordings. This is the
+#      recordings' seriesInetref - the one the series artwork is fetched for
+#
+# The recordings are shared with the previous index (see BackendRecordings), which may still be
+# building views of them for the requests it is serving - so a recording whose seriesTitle or
+# seriesInetref changes is replaced by a copy in the new index, rather than changed.
+####################################################################################################
+
+SERIES_ARTICLES = ["the", "a", "an"]
+
+class SeriesCluster(object):
+	__slots__ = ('title', 'inetref', 'count', 'titles', 'byInetref')
+
+	def __init__(self, title, inetref, count, titles, byInetref):
+		self.title = title
+		self.inetref = inetref
+		self.count = count
+		self.titles = titles			# the titles of its recordings
+		self.byInetref = byInetref		# whether it is the series of an inetref (so other titles may join it)
+
+# The title, normalised: the (lower case, unaccented) words of the title - less a leading article:
+def SeriesKey(title):
+	words = SearchTokens(title or u"")
+	if len(words) > 1 and words[0] in SERIES_ARTICLES:
+		words = words[1:]
+	return u" ".join(words)
+
+# Returns the most common value of a {value : count} dictionary (ties going to the smallest):
+def MostCommon(counts):
+	return min(counts.items(), key = lambda (value, count): (-count, value))[0]
+
+# Clusters the recordings (a list of the index being built) into series, and returns {series
+# title : SeriesCluster}. The recordings getting another seriesTitle or seriesInetref are replaced
+# by copies in the list:
+def ClusterSeries(recordings):
+	# Group the recordings (their positions in the list) by title key:
+	titleKeys = {}	# {title : title key} - there are far fewer titles than recordings
+	groups = collections.OrderedDict()	# {title key : [position]}
+	for position, recording in enumerate(recordings):
+		titleKey = titleKeys.get(recording.title)
+		if titleKey is None:
+			titleKey = titleKeys[recording.title] = SeriesKey(recording.title)
+		groups.setdefault(titleKey, []).append(position)
+
+	# Merge the groups sharing a dominant inetref - the one held by most of the recordings with
+	# an inetref (so a few recordings with a wrong inetref can't merge two series):
+	clusters = collections.OrderedDict()	# {inetref or title key : [position]}
+	for titleKey, positions in groups.items():
+		key = ('title', titleKey)
+		inetrefCounts = CountValues(recordings[position].inetref for position in positions if not recordings[position].inetref is None)
+		if len(inetrefCounts) > 0:
+			inetref = MostCommon(inetrefCounts)
+			if inetrefCounts[inetref] * 2 > sum(inetrefCounts.values()):
+				key = ('inetref', inetref)
+		clusters.setdefault(key, []).extend(positions)
+
+	series = {}
+	for key, positions in clusters.items():
+		members = [recordings[position] for position in positions]
+		inetref = None
+		inetrefCounts = CountValues(recording.inetref for recording in members if not recording.inetref is None)
+		if len(inetrefCounts) > 0:
+			inetref = MostCommon(inetrefCounts)
+		titleCounts = CountValues(recording.title for recording in members)
+		cluster = SeriesCluster(MostCommon(titleCounts), inetref, len(members), sorted(titleCounts.keys()), key[0] == 'inetref')
+		series[cluster.title] = cluster
+
+		for position, recording in zip(positions, members):
+			if recording.seriesTitle != cluster.title or recording.seriesInetref != cluster.inetref:
+				recording = recordings[position] = copy.copy(recording)
+				recording.seriesTitle = cluster.title
+				recording.seriesInetref = cluster.inetref
+	return series
+
+# Returns {value : number of times it occurs}:
+def CountValues(values):
+	counts = {}
+	for value in values:
+		counts[value] = counts.get(value, 0) + 1
+	return counts
+
+####################################################################################################
+# Sorted views:
+# =============
+# Paging through a long recording list used to filter and sort the whole list again for every
+# page. Instead, the filtered and sorted list is kept with the recording index (see
+# RecordingIndex.SortedView), so a page is just a slice of it.
+#
+# A page is identified by a cursor: the sort key and ID of the recording before it (plus its
+# position, for unsorted views). When the recording index has been refreshed, the cursor still
+# finds the right place in the new view - even if that recording has been deleted since.
+#
+# Views are cached per recording index - the MAX_SORTED_VIEWS most recently used ones.
+####################################################################################################
+
+MAX_SORTED_VIEWS = 50
+VIEW_LOCK = Thread.Lock()
+
+class SortedView(object):
+	def __init__(self, recordings, sortKeyName, sortReverse):
+		self.sortKeyName = sortKeyName
+		self.sortReverse = bool(sortReverse)
+
+		# Sort by (key, ID) - so even recordings with the same key have a well-defined order:
+		self.keys = []	# ascending
+		if sortKeyName is None:
+			self.recordings = list(recordings)
+		else:
+			self.recordings = sorted(recordings, key = self.SortKey)
+			self.keys = [self.SortKey(recording) for recording in self.recordings]
+			if self.sortReverse:
+				self.recordings.reverse()
+
+		self.positions = {}
+		for position, recording in enumerate(self.recordings):
+			self.positions[recording.id] = position
+
+	def SortKey(self, recording):
+		return (GetField(recording, self.sortKeyName), recording.id)
+
+	# Returns the cursor for the page starting after the recording at position:
+	def Cursor(self, position):
+		recording = self.recordings[position]
+		sortValue = None
+		if not self.sortKeyName is None:
+			sortValue = GetField(recording, self.sortKeyName)
+		return json.dumps([sortValue, recording.id, position])
+
+	# Returns the position of the page identified by cursor:
+	def Find(self, cursor):
+		try:
+			sortValue, recordingId, position = json.loads(cursor)
+		except (ValueError, TypeError):
+			Log("SortedView: bad cursor %s" % cursor)
+			return 0
+
+		found = self.positions.get(recordingId)
+		if not found is None:
+			return found + 1
+
+		# The recording is gone - find where it would have been:
+		if self.sortKeyName is None:
+			return min(int(position) + 1, len(self.recordings))
+		if self.sortReverse:
+			return len(self.keys) - bisect.bisect_left(self.keys, (sortValue, recordingId))
+		return bisect.bisect_right(self.keys, (sortValue, recordingId))
+
+####################################################################################################
+# Search index:
+# =============
+# An inverted index of the words in the (unmangled) title, subtitle, description and channel
+# name of the recordings - so a search only looks at the recordings containing the words searched
+# for, rather than scanning every description.
+#
+# Words are normalised (see SearchTokens): lower case, without accents. A search term matches the
+# words it is a prefix of (so "sher" finds "Sherlock") - except for single letters, which only
+# match whole words. A recording must match every term of the query.
+#
+# Recordings are ranked by where the terms were found (SearchFields weights), whole-word matches
+# counting twice as much as prefix matches - and newest first, for equal ranks.
+#
+# The index is built for a recording index on its first search (and, once someone has searched,
+# whenever the recording index is refreshed).
+####################################################################################################
+
+# (RecordingEntry attribute, weight) - a word found in several fields counts with the highest:
+SearchFields = \
+	[
+		('title', 8),
+		('subTitle', 4),
+		('channelName', 2),
+		('description', 1)
+	]
+
+SEARCH_MIN_PREFIX = 2
+SEARCH_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+SEARCH_LOCK = Thread.Lock()
+SEARCH_USED = False
+
+class SearchIndex(object):
+	def __init__(self, recordings):
+		startTime = time.time()
+		self.recordings = recordings
+
+		# {word : (positions, weights)} - the recordings containing the word, as positions in
+		# recordings (ascending), with the weight of the word in each:
+		postings = {}
+		tokenCache = {} # titles, subtitles and channel names repeat - tokenize them once
+		for position, recording in enumerate(recordings):
+			weights = {}
+			for attribute, weight in SearchFields:
+				text = getattr(recording, attribute)
+				if text is None:
+					continue
+				if attribute == 'description':
+					tokens = SearchTokens(text)
+				else:
+					tokens = tokenCache.get(text)
+					if tokens is None:
+						tokens = tokenCache[text] = SearchTokens(text)
+				for token in tokens:
+					if weights.get(token, 0) < weight:
+						weights[token] = weight
+
+			for token, weight in weights.iteritems():
+				posting = postings.get(token)
+				if posting is None:
+					posting = postings[token] = (array.array('i'), array.array('b'))
+				posting[0].append(position)
+				posting[1].append(weight)
+
+		self.postings = postings
+		self.words = sorted(postings.keys())	# for prefix lookups
+
+		RecordTiming(PHASE_TIMINGS, "BuildSearchIndex", time.time() - startTime)
+
+	# Returns the recordings matching all the (normalised) terms, best matches first:
+	def Search(self, terms):
+		scores = None
+		for term in sorted(terms, key = len, reverse = True): # longest (most selective) first
+			termScores = self.Match(term)
+			if scores is None:
+				scores = termScores
+			else:
+				scores = dict((position, score + termScores[position]) for position, score in scores.iteritems() if position in termScores)
+			if len(scores) == 0:
+				return []
+		if scores is None:
+			return []
+
+		ranked = sorted(scores.iteritems(), key = lambda (position, score): (-score, -position))
+		return [self.recordings[position] for position, score in ranked]
+
+	# Returns {position : score} for the recordings matching one term:
+	def Match(self, term):
+		scores = {}
+		for word in itertools.islice(self.words, bisect.bisect_left(self.words, term), None):
+			if not word.startswith(term):
+				break
+			factor = 1
+			if word == term:
+				factor = 2
+			elif len(term) < SEARCH_MIN_PREFIX:
+				break
+
+			positions, weights = self.postings[word]
+			for position, weight in itertools.izip(positions, weights):
+				score = weight * factor
+				if scores.get(position, 0) < score:
+					scores[position] = score
+		return scores
+
+# Returns the normalised words of a text: lower case, without accents:
+def SearchTokens(text):
+	if text is None:
+		return []
+	if not isinstance(text, unicode):
+		text = text.decode('utf-8', 'replace')
+	text = text.lower()
+	try:
+		text.encode('ascii')
+	except UnicodeError:
+		text = u''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+	return SEARCH_TOKEN_PATTERN.findall(text)
+
 ####################################################################################################
 # GetField:
 # =========
-# Gets the value of a field in the recording AFTER having performed alias substitution on it,
+# Gets the value of a field (one of the RecordingFields keys) in the recording.
 #
-# The value thus found is passed through an aliasing mechanism, intended to conflate almost-identical
-# values (like "Series" and "Serie" or "Tonight Show" and "The Tonight Show"). See the LoadAliases
-# function for details.
+# The values are the derived ones: titles unmangled, categories mapped to their canonical names
+# (see "Title rules") and titles clustered into series (see "Series clusters"). That is all done
+# when the recordings are read, so this is a simple attribute lookup.
 #
 # Return:
 #    string
 #
 ####################################################################################################
 def GetField(recording, fieldName):
-	if UNMANGLE_TITLES == True:
-		if fieldName == "Title" or fieldName == "SubTitle":
-			subtitle = recording.find('SubTitle').text
-			if not subtitle is None:
-				subtitle = subtitle.decode()
-
-			title = recording.find('Title').text
-			if not title is None:
-				title = title.decode()
-				#Log("TITLE = '%s'" % title)
-		
-			dontSplit = False
-			for nosplitter in TITLE_NOSPLITTERS:
-				dontSplit = re.search(nosplitter, title)
-				if dontSplit:
-					break
-
-			if not dontSplit:
-				for splitter in TITLE_SPLITTERS:
-					splitResult = title.split(splitter, 1)
-					if len(splitResult) == 2:
-						orgTitle = title
-						title,newsubtitle = splitResult
-						title = title.strip()
-						newsubtitle = newsubtitle.strip()
-						if subtitle:
-							subtitle = newsubtitle# + " - " + subtitle
-						else:
-							subtitle = newsubtitle
-						break
-						
-			if fieldName == "Title":
-				return title
-			if fieldName == 'SubTitle':
-				return subtitle
-
-	if fieldName == "Category":
-		keyAliases = LoadAliases('categoryAliases')
-		orgKeyValue = recording.find(fieldName).text
-		if not orgKeyValue is None:
-			orgKeyValue = orgKeyValue.decode()
-		return MapAliases(orgKeyValue, keyAliases)
-
-	result = recording.find(fieldName).text
-	if not result is None:
-		result = result.decode()
-
-	return result
+	return getattr(recording, RecordingFields[fieldName])
 
+####################################################################################################
+# UnmangleTitle:
+# ==============
+# Moves any subtitle embedded in the title to the subtitle (see "Title splitting" above).
+#
+# Return:
+#    (title, subtitle) tuple
+#
+####################################################################################################
+def UnmangleTitle(title, subtitle, rules):
+	if UNMANGLE_TITLES != True or title is None:
+		return (title, subtitle)
+
+	dontSplit = not rules.exemptions is None and rules.exemptions.search(title)
+
+	if not dontSplit:
+		for splitter in rules.splitters:
+			splitResult = title.split(splitter, 1)
+			if len(splitResult) == 2:
+				title,newsubtitle = splitResult
+				title = title.strip()
+				newsubtitle = newsubtitle.strip()
+				if subtitle:
+					subtitle = newsubtitle# + " - " + subtitle
+				else:
+					subtitle = newsubtitle
+				break
+
+	return (title, subtitle)
 
 ####################################################################################################
 # MapAlias:
 # =========
-# Maps a string into its canonical version (if any), using an alias list loaded by LoadAliases.
+# Maps a string into its canonical version (if any), using an {alias : canonical name} dictionary
+# compiled from alias lists (see TitleRules).
 #
 # Return:
 #    string
 #
 # Example:
-#    Assume the JSON formatted alias string from the LoadAliases description:
+#    Assume the alias lists
 #       [['Series', 'serie', 'series'], ['Movies', 'film', 'action']]
 #    This will produce the following mappings:
 #       'action' => 'Movies'
@@ -918,47 +3902,9 @@ def MapAliases(keyValue, keyAliases):
 	if keyValue is None:
 		keyValue = ''
 
-	result = keyValue
-	
-	if isinstance(keyAliases, list): 
-		for aliasList in keyAliases:
-			if (keyValue in aliasList):
-				result = aliasList[0]
-
-	return result
+	return keyAliases.get(keyValue, keyValue)
 
 
-####################################################################################################
-# LoadAliases:
-# ============
-# Loads a list of aliases from the preferences string specified by the parameter aliasPrefName.
-#
-# The alias list if a JSON formatted list of list of strings. Each list-of-strings is interpreted
-# as a canonical name, followed by its synonyms.
-#
-# Return:
-#    list of list of strings
-#
-# Example:
-#    The following JSON formatted alias string defines the canonical names 'Series' and 'Movies', 
-#    and two synonyms for each:
-#       [['Series', 'serie', 'series'], ['Movies', 'film', 'action']]
-####################################################################################################
-def LoadAliases(aliasPrefName):
-	if aliasPrefName is None:
-		return []
-	if aliasPrefName == "":
-		return []
-
-	# Workaround:
-	# =========== 
-	# It is really difficult to edit a list-of-lists in the preferences editor
-	# - so we're moving the aliases to hardcoded variables for now:
-	if aliasPrefName == "categoryAliases":
-		return CategoryAliases
-
-	return []
-
 #####################################################################################################
 def StringPref(key, errors):
 	if Prefs[key] is None:
@@ -993,15 +3939,57 @@ def ValidatePrefs():
 	port = IntPref('port', errors)
 	PVR_URL = 'http://%s:%s/' % (server, port)
 
+	# Check BACKEND_URLS
+	global BACKEND_URLS
+	BACKEND_URLS = [PVR_URL]
+	for backend in (Prefs['otherBackends'] or "").split(','):
+		backend = backend.strip()
+		if backend == "":
+			continue
+		if not re.match(r'^[\w.-]+(:\d+)?$', backend):
+			errors.append("otherBackends: '%s' is not a host name or host:port" % backend)
+			continue
+		if not ':' in backend:
+			backend = "%s:%s" % (backend, port)
+		url = 'http://%s/' % backend
+		if not url in BACKEND_URLS:
+			BACKEND_URLS.append(url)
+
+	# Check LOCAL_STORAGE_GROUPS (see "Local playback"):
+	global LOCAL_STORAGE_GROUPS
+	LOCAL_STORAGE_GROUPS = {}
+	for mapping in (Prefs['localStorageGroups'] or "").split(','):
+		mapping = mapping.strip()
+		if mapping == "":
+			continue
+		storageGroup, separator, directory = mapping.partition('=')
+		storageGroup = storageGroup.strip()
+		directory = directory.strip()
+		if separator == "" or storageGroup == "" or not os.path.isabs(directory):
+			errors.append("localStorageGroups: '%s' is not storage-group=/local/directory" % mapping)
+			continue
+		LOCAL_STORAGE_GROUPS.setdefault(storageGroup, []).append(os.path.normpath(directory))
+
+	# Check BACKEND_CONNECT_TIMEOUT and BACKEND_READ_TIMEOUT
+	global BACKEND_CONNECT_TIMEOUT, BACKEND_READ_TIMEOUT
+	BACKEND_CONNECT_TIMEOUT = IntPref('backendConnectTimeout', errors)
+	if not BACKEND_CONNECT_TIMEOUT or BACKEND_CONNECT_TIMEOUT <= 0:
+		errors.append("backendConnectTimeout is %s - must be positive" % BACKEND_CONNECT_TIMEOUT)
+		BACKEND_CONNECT_TIMEOUT = 5
+	BACKEND_READ_TIMEOUT = IntPref('backendReadTimeout', errors)
+	if not BACKEND_READ_TIMEOUT or BACKEND_READ_TIMEOUT <= 0:
+		errors.append("backendReadTimeout is %s - must be positive" % BACKEND_READ_TIMEOUT)
+		BACKEND_READ_TIMEOUT = 30
+
 	#Log('ValidatePrefs: PVR URL = %s' % PVR_URL)
 	try:
-		testXML = InternalGetRecordedListUnCached(1)
+		testHeader, testEntries = InternalGetRecordedListUnCached(PVR_URL, 1)
 		#Log("InternalGetRecordedListUnCached succeeded")
 
 		# Should we test the 
 		#    <Version>0.25.20110928-1</Version>
 		# element for ver >= 0.27
-		version = testXML.find('Version').text
+		version = testHeader['Version']
 		major, minor, rest = version.split('.', 2)
 		major = int(major)
 		minor = int(minor)
@@ -1038,6 +4026,54 @@ def ValidatePrefs():
 	if DATA_CACHE_TIME and DATA_CACHE_TIME < 0:
 		errors.append("cacheTime is %s - must be non-negative" % DATA_CACHE_TIME)
 
+	# Check BACKGROUND_REFRESH
+	global BACKGROUND_REFRESH
+	BACKGROUND_REFRESH = BoolPref('refreshInBackground', errors)
+
+	# Check MAX_STALE_TIME
+	global MAX_STALE_TIME
+	MAX_STALE_TIME = IntPref('maxStaleTime', errors)
+	if MAX_STALE_TIME and MAX_STALE_TIME < 0:
+		errors.append("maxStaleTime is %s - must be non-negative" % MAX_STALE_TIME)
+
+	# Check INCREMENTAL_SYNC
+	global INCREMENTAL_SYNC
+	INCREMENTAL_SYNC = BoolPref('incrementalSync', errors)
+
+	# Check FULL_RELOAD_TIME
+	global FULL_RELOAD_TIME
+	FULL_RELOAD_TIME = IntPref('fullReloadTime', errors)
+	if FULL_RELOAD_TIME and FULL_RELOAD_TIME < 0:
+		errors.append("fullReloadTime is %s - must be non-negative" % FULL_RELOAD_TIME)
+
+	# Check USE_ARTWORK_CACHE
+	global USE_ARTWORK_CACHE
+	USE_ARTWORK_CACHE = BoolPref('useArtworkCache', errors)
+
+	# Check ARTWORK_CACHE_SIZE
+	global ARTWORK_CACHE_SIZE
+	artworkCacheSize = IntPref('artworkCacheSize', errors)
+	if not artworkCacheSize is None:
+		ARTWORK_CACHE_SIZE = artworkCacheSize * 1024 * 1024
+
+	# Check PREFETCH_ARTWORK
+	global PREFETCH_ARTWORK
+	PREFETCH_ARTWORK = BoolPref('prefetchArtwork', errors)
+
+	# Check PROFILE_EVERY and PROFILE_SLOWER_THAN
+	global PROFILE_EVERY, PROFILE_SLOWER_THAN
+	PROFILE_EVERY = IntPref('profileEvery', errors) or 0
+	if PROFILE_EVERY and PROFILE_EVERY < 0:
+		errors.append("profileEvery is %s - must be non-negative" % PROFILE_EVERY)
+		PROFILE_EVERY = 0
+	profileSlowerThan = IntPref('profileSlowerThan', errors)
+	if profileSlowerThan and profileSlowerThan < 0:
+		errors.append("profileSlowerThan is %s - must be non-negative" % profileSlowerThan)
+		profileSlowerThan = 0
+	PROFILE_SLOWER_THAN = (profileSlowerThan or 0) / 1000.0
+	if (PROFILE_EVERY or PROFILE_SLOWER_THAN) and cProfile is None:
+		Log("ValidatePrefs: profiling is not available")
+
 	# Check DETECT_SERIES_BY_TITLE
 	global DETECT_SERIES_BY_TITLE
 	DETECT_SERIES_BY_TITLE = BoolPref('detectSeriesByTitle', errors)
@@ -1046,6 +4082,25 @@ def ValidatePrefs():
 	global UNMANGLE_TITLES
 	UNMANGLE_TITLES = BoolPref('unmangleTitles', errors)
 
+	# Check LISTEN_FOR_EVENTS and EVENT_PORT
+	global LISTEN_FOR_EVENTS, EVENT_PORT
+	LISTEN_FOR_EVENTS = BoolPref('listenForEvents', errors)
+	eventPort = IntPref('eventPort', errors)
+	if not eventPort is None:
+		EVENT_PORT = eventPort
+
+	# The recording index depends on the settings above - rebuild it:
+	global RECORDING_INDEX
+	RECORDING_INDEX = None
+	PUSHDOWN_LOCK.acquire()
+	try:
+		PUSHDOWN_INDEXES.clear()
+		PUSHDOWN_IGNORED.clear()
+	finally:
+		PUSHDOWN_LOCK.release()
+
+	StartEventListeners()
+
 
 	#Log("PVR_URL = %s" % PVR_URL)
 	#Log("CACHE_TIME = %s" % CACHE_TIME)
@@ -0,0 +1,339 @@
+# MythRecordings plug-in for Plex
+# Copyright (C) 2013 Thomas Schaumburg
+#
+# Benchmarks the plug-in routes outside Plex Media Server, against synthetic libraries (see
+# synthetic_library.py) served by a local stand-in for the MythTV backend (see
+# mythtv_standin.py).
+#
+# Usage:
+#    python Tools/benchmark.py [--sizes 1000,10000,50000] [--repeat 5] [--cases NAME,...]
+#                              [--backend-latency SECONDS]
+#                              [--output results.json] [--baseline baseline.json]
+#
+# For each library size, every case is run in a fresh Python process, so the memory figures
+# aren't distorted by the cases run before it. Each case reports
+#    - first:  the time of the first call (for the "warm" cases: the first call after the
+#              recording index has been loaded)
+#    - median: the median time of the --repeat calls following it
+#    - peak:   the peak memory growth (RSS) over the case, in KB
+#
+# The results are written to --output as JSON. Pass an earlier results file as --baseline to
+# see the changes since.
+#
+# Requires Python 2.7 (like Plex), and Linux for the memory figures.
+
+import datetime
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+TOOLS_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_PATH)
+
+import mythtv_standin
+import synthetic_library
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+DEFAULT_REPEAT = 5
+
+# The prefs used for all cases - background work is switched off, so the timings only
+# include the work done for the request itself:
+BENCHMARK_PREFS = {
+	'refreshInBackground': False,
+	'prefetchArtwork': False,
+}
+
+####################################################################################################
+# Cases:
+# ======
+# Each case is (setup, run): setup(plugin) prepares the plug-in (and returns the arguments for
+# run), run(plugin, args) is the code being timed.
+####################################################################################################
+
+def NoSetup(plugin):
+	return None
+
+def LoadIndex(plugin):
+	return plugin['InternalGetRecordedList']()
+
+def ExpireIndex(plugin):
+	index = plugin['InternalGetRecordedList']()
+	expired = datetime.datetime.now() - datetime.timedelta(seconds = plugin['DATA_CACHE_TIME'] + 1)
+	plugin['RECORDING_INDEX'] = index.Restamp(expired)
+	return None
+
+def ListTitles(plugin, args):
+	return plugin['GroupRecordingsBy'](groupByList = ['Title'])
+
+def StartAndListTitles(plugin, args):
+	plugin['Start']()
+	return ListTitles(plugin, args)
+
+# A deep link into a series, with nothing loaded yet:
+def StartAndOpenSeries(plugin, args):
+	plugin['Start']()
+	return plugin['GroupRecordingsBy'](groupByList = [], filterBy = {'Title': synthetic_library.SERIES[0]})
+
+def BiggestGroup(index, groupByList):
+	node = index.groupTrees[tuple(groupByList)]
+	return max(node.entries, key = lambda entry: entry.node.count).name
+
+def SetupLastTitlePage(plugin):
+	index = LoadIndex(plugin)
+	entries = index.groupTrees[('Title',)].entries
+	pageSize = plugin['MAX_EPISODES_PER_PAGE']
+	return max(0, (len(entries) - 1) // pageSize * pageSize)
+
+def SetupSeries(plugin):
+	return BiggestGroup(LoadIndex(plugin), ['Title'])
+
+def SetupCategory(plugin):
+	return BiggestGroup(LoadIndex(plugin), ['Category', 'Title'])
+
+def SetupDeepPage(plugin):
+	index = LoadIndex(plugin)
+	view = index.SortedView({}, 'StartTime', True)
+	return view.Cursor(len(view.recordings) // 2)
+
+def SetupRecordingInfo(plugin):
+	recording = LoadIndex(plugin).recordings[0]
+	return (recording.chanId, recording.recordingStart)
+
+CASES = [
+	# Starting up (Start() included):
+	('cold start', NoSetup, StartAndListTitles),
+	('snapshot start', NoSetup, StartAndListTitles),
+	('cold deep link', NoSetup, StartAndOpenSeries),
+	('expired index', ExpireIndex, ListTitles),
+
+	# Browsing, with the recording index loaded:
+	('main menu', LoadIndex, lambda plugin, args: plugin['MainMenu']()),
+	('titles', LoadIndex, ListTitles),
+	('titles, last page', SetupLastTitlePage,
+		lambda plugin, startWith: plugin['GroupRecordingsBy'](groupByList = ['Title'], startWith = startWith)),
+	('series', SetupSeries,
+		lambda plugin, title: plugin['GroupRecordingsBy'](groupByList = [], filterBy = {'Title': title})),
+	('categories', LoadIndex,
+		lambda plugin, args: plugin['GroupRecordingsBy'](groupByList = ['Category', 'Title'])),
+	('category titles', SetupCategory,
+		lambda plugin, category: plugin['GroupRecordingsBy'](groupByList = ['Title'], filterBy = {'Category': category})),
+	('channels (ad hoc grouping)', LoadIndex,
+		lambda plugin, args: plugin['GroupRecordingsBy'](groupByList = ['Channel/ChanId'])),
+	('by date', LoadIndex,
+		lambda plugin, args: plugin['GetRecordingList'](sortKeyName = 'StartTime')),
+	('by date, middle page', SetupDeepPage,
+		lambda plugin, cursor: plugin['GetRecordingList'](sortKeyName = 'StartTime', cursor = cursor)),
+	('recording info', SetupRecordingInfo,
+		lambda plugin, (chanId, startTime): plugin['RecordingInfo'](chanId, startTime)),
+]
+
+# The cases that only make sense once (the first call changes the state being measured):
+SINGLE_SHOT_CASES = ['cold start', 'snapshot start', 'cold deep link', 'expired index']
+
+# The cases that start the plug-in themselves:
+START_CASES = ['cold start', 'snapshot start', 'cold deep link']
+
+####################################################################################################
+# Memory measurement:
+####################################################################################################
+
+def CurrentRss():
+	try:
+		pages = int(open('/proc/self/statm').read().split()[1])
+		return pages * resource.getpagesize() // 1024
+	except (IOError, OSError):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Samples the RSS in the background, remembering the peak:
+class RssSampler(object):
+	def __init__(self, interval = 0.005):
+		self.interval = interval
+		self.start = CurrentRss()
+		self.peak = self.start
+		self.running = True
+		self.thread = threading.Thread(target = self.Sample)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def Sample(self):
+		while self.running:
+			self.peak = max(self.peak, CurrentRss())
+			time.sleep(self.interval)
+
+	def Stop(self):
+		self.running = False
+		self.thread.join()
+		self.peak = max(self.peak, CurrentRss())
+		return self.peak - self.start
+
+####################################################################################################
+# Running the cases:
+####################################################################################################
+
+# Runs one case in this process - see RunCase:
+def RunCaseHere(port, caseName, repeat, loadData, saveData):
+	import pickle
+	import plex_stubs
+
+	setup, run = dict((name, (setup, run)) for name, setup, run in CASES)[caseName]
+
+	prefs = dict(BENCHMARK_PREFS)
+	prefs['server'] = '127.0.0.1'
+	prefs['port'] = str(port)
+
+	data = None
+	if loadData:
+		data = pickle.load(open(loadData, 'rb'))
+	plugin = plex_stubs.LoadPlugin(prefs, data, start = not caseName in START_CASES)
+	args = setup(plugin)
+
+	if caseName in SINGLE_SHOT_CASES:
+		repeat = 0
+
+	sampler = RssSampler()
+	startTime = time.time()
+	run(plugin, args)
+	first = time.time() - startTime
+
+	times = []
+	for i in range(repeat):
+		startTime = time.time()
+		run(plugin, args)
+		times.append(time.time() - startTime)
+	peak = sampler.Stop()
+
+	if saveData:
+		pickle.dump(plugin['Data'], open(saveData, 'wb'), pickle.HIGHEST_PROTOCOL)
+
+	result = {'first': first, 'peakKB': peak}
+	if times:
+		times.sort()
+		result['median'] = times[len(times) // 2]
+	return result
+
+# Runs one case in a fresh process:
+def RunCase(port, caseName, repeat, loadData = None, saveData = None):
+	command = [sys.executable, os.path.abspath(__file__), '--run-case', caseName,
+		'--port', str(port), '--repeat', str(repeat)]
+	if loadData:
+		command = command + ['--load-data', loadData]
+	if saveData:
+		command = command + ['--save-data', saveData]
+
+	output = subprocess.check_output(command)
+	return json.loads(output.strip().splitlines()[-1])
+
+def RunBenchmark(sizes, caseNames, repeat, backendLatency = None):
+	results = {}
+	for size in sizes:
+		sys.stderr.write("Generating a library of %d recordings...\n" % size)
+		faults = mythtv_standin.Faults()
+		if backendLatency:
+			faults.latency = backendLatency
+		server = mythtv_standin.StartStandin(size, faults = faults)
+		port = server.server_address[1]
+		dataFile = tempfile.mktemp(prefix = 'mythrecordings-benchmark-')
+		try:
+			for caseName in caseNames:
+				loadData = saveData = None
+				if caseName == 'cold start':
+					saveData = dataFile
+				elif caseName == 'snapshot start':
+					if not os.path.exists(dataFile):
+						RunCase(port, 'cold start', 0, saveData = dataFile)
+					loadData = dataFile
+
+				result = RunCase(port, caseName, repeat, loadData, saveData)
+				results["%d: %s" % (size, caseName)] = result
+				sys.stderr.write("%6d  %-28s %s\n" % (size, caseName, FormatResult(result)))
+		finally:
+			server.shutdown()
+			if os.path.exists(dataFile):
+				os.remove(dataFile)
+	return results
+
+def FormatResult(result):
+	text = "first %8.1f ms" % (result['first'] * 1000)
+	if 'median' in result:
+		text = text + "  median %8.1f ms" % (result['median'] * 1000)
+	else:
+		text = text + " " * 18
+	return text + "  peak %8d KB" % result['peakKB']
+
+def Compare(results, baseline):
+	print "%-36s %12s %12s %8s %12s %12s" % ("case", "time (ms)", "baseline", "change", "peak (KB)", "baseline")
+	for key in sorted(results.keys(), key = lambda key: (int(key.split(':')[0]), key)):
+		result = results[key]
+		old = baseline.get(key)
+		measure = 'median' if 'median' in result else 'first'
+		line = "%-36s %12.1f" % (key, result[measure] * 1000)
+		if old is None or not measure in old:
+			print line
+			continue
+		change = ""
+		if old[measure] > 0:
+			change = "%+7.0f%%" % ((result[measure] - old[measure]) * 100.0 / old[measure])
+		print "%s %12.1f %8s %12d %12d" % (line, old[measure] * 1000, change, result['peakKB'], old['peakKB'])
+
+def Main():
+	parser = optparse.OptionParser(usage = "%prog [options]")
+	parser.add_option('--sizes', default = ",".join(str(size) for size in DEFAULT_SIZES),
+		help = "comma-separated library sizes (default: %default)")
+	parser.add_option('--cases', default = None,
+		help = "comma-separated names of the cases to run (default: all)")
+	parser.add_option('--repeat', type = 'int', default = DEFAULT_REPEAT,
+		help = "calls to time after the first one (default: %default)")
+	parser.add_option('--backend-latency', type = 'float', default = None,
+		help = "seconds the backend stand-in waits before responding (default: none)")
+	parser.add_option('--output', default = 'benchmark-results.json',
+		help = "where to write the results (default: %default)")
+	parser.add_option('--baseline', default = None,
+		help = "results of an earlier run to compare with")
+	parser.add_option('--list', action = 'store_true', help = "list the cases")
+
+	# Internal - used for running a single case in a fresh process:
+	parser.add_option('--run-case', help = optparse.SUPPRESS_HELP)
+	parser.add_option('--port', type = 'int', help = optparse.SUPPRESS_HELP)
+	parser.add_option('--load-data', help = optparse.SUPPRESS_HELP)
+	parser.add_option('--save-data', help = optparse.SUPPRESS_HELP)
+
+	options, args = parser.parse_args()
+
+	if options.list:
+		for name, setup, run in CASES:
+			print name
+		return
+
+	if options.run_case:
+		result = RunCaseHere(options.port, options.run_case, options.repeat, options.load_data, options.save_data)
+		print json.dumps(result)
+		return
+
+	caseNames = [name for name, setup, run in CASES]
+	if options.cases:
+		caseNames = [name.strip() for name in options.cases.split(',')]
+	sizes = [int(size) for size in options.sizes.split(',')]
+
+	results = RunBenchmark(sizes, caseNames, options.repeat, options.backend_latency)
+
+	output = {
+		'timestamp': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+		'python': sys.version.split()[0],
+		'repeat': options.repeat,
+		'backendLatency': options.backend_latency,
+		'results': results
+	}
+	json.dump(output, open(options.output, 'w'), indent = 1, sort_keys = True)
+	sys.stderr.write("Results written to %s\n" % options.output)
+
+	if options.baseline:
+		Compare(results, json.load(open(options.baseline))['results'])
+
+if __name__ == '__main__':
+	Main()
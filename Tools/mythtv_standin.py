@@ -0,0 +1,620 @@
+# MythRecordings plug-in for Plex
+# Copyright (C) 2013 Thomas Schaumburg
+#
+# A stand-in for the MythTV backend services API - the parts of it the plug-in uses - serving a
+# synthetic library (see synthetic_library.py). With it, the caching and concurrency behaviour
+# of the plug-in can be measured on one box, without a real backend:
+#
+#    python Tools/mythtv_standin.py --port 6544 --size 10000 --latency 0.2
+#
+# and point the plug-in (server/port prefs) at it.
+#
+# With --event-port, it also stands in for the backend protocol - as far as monitors listening
+# for RECORDING_LIST_CHANGE events are concerned (see EventServer, and the listenForEvents and
+# eventPort prefs).
+#
+# Endpoints:
+#    Dvr/GetRecordedList       StartIndex, Count, Descending, TitleRegEx (ignoring case), RecGroup,
+#                              StorageGroup
+#    Dvr/GetRecorded           ChanId, StartTime
+#    Content/GetPreviewImage   ChanId, StartTime, Width, Height
+#    Content/GetRecordingArtwork   Inetref, Type, Width, Height (404 without an inetref)
+#    Content/GetRecording      ChanId, StartTime - redirects to Content/GetFile
+#    Content/GetFile           StorageGroup, FileName (supports Range requests)
+#
+# Faults can be injected into the responses (see Faults) - from the command line, or while
+# running, through the control endpoints:
+#    Standin/Faults            sets the faults given as parameters (same names as the
+#                              command line options, e.g. ?latency=0.5&errorRate=0.1)
+#    Standin/Stats             request counts per endpoint (JSON)
+#    Standin/AddRecordings     adds Count new recordings (newest)
+#    Standin/DeleteRecording   deletes the recording with ChanId, StartTime
+#    Standin/UpdateRecording   moves the recording with ChanId, StartTime to RecGroup
+#    Standin/Event             sends the event Message (e.g. "RECORDING_LIST_CHANGE") as is
+#
+# Adding, deleting and updating recordings sends the events the backend would.
+#
+# Requires Python 2.7.
+
+import BaseHTTPServer
+import SocketServer
+import bisect
+import datetime
+import json
+import optparse
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import urllib
+import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic_library
+
+# The size of the synthetic recording files served by Content/GetFile:
+DEFAULT_FILE_SIZE = 8 * 1024 * 1024
+WRITE_CHUNK_SIZE = 64 * 1024
+
+####################################################################################################
+# Faults:
+# =======
+# What to do to the responses:
+#    latency, jitter:        wait latency seconds (+/- up to jitter seconds) before responding
+#    bandwidth:              send no more than this many bytes per second
+#    dripSize, dripDelay:    send the body dripSize bytes at a time, waiting dripDelay seconds
+#                            between them (slow-drip)
+#    errorRate, errorStatus: answer this fraction of the requests with errorStatus instead
+#    dropRate:               close the connection halfway through this fraction of the responses
+#    endpoints:              only inject faults into these endpoints (None: all of them)
+####################################################################################################
+
+class Faults(object):
+	def __init__(self):
+		self.latency = 0.0
+		self.jitter = 0.0
+		self.bandwidth = None
+		self.dripSize = None
+		self.dripDelay = 0.0
+		self.errorRate = 0.0
+		self.errorStatus = 503
+		self.dropRate = 0.0
+		self.endpoints = None
+
+	def Set(self, name, value):
+		if not hasattr(self, name):
+			raise ValueError("unknown fault: %s" % name)
+		if name == 'endpoints':
+			value = [endpoint.strip('/') for endpoint in value.split(',')] if value else None
+		elif name in ('bandwidth', 'dripSize', 'errorStatus'):
+			value = int(value) if value not in (None, '', 'None') else None
+		else:
+			value = float(value)
+		setattr(self, name, value)
+
+	def AppliesTo(self, endpoint):
+		return self.endpoints is None or endpoint in self.endpoints
+
+	def AsDict(self):
+		return dict(self.__dict__)
+
+####################################################################################################
+# Library:
+# ========
+# The recordings served - oldest first, like Dvr/GetRecordedList returns them.
+####################################################################################################
+
+class Library(object):
+	def __init__(self, size, seed = 1, inProgress = 2):
+		self.lock = threading.Lock()
+		self.programs = synthetic_library.MakePrograms(size, seed, inProgress)
+		self.byId = {}
+		for program in self.programs:
+			self.byId[(program['ChanId'], program['StartTs'])] = program
+		self.nextSeed = seed + 1
+		self.fullList = None	# the full Dvr/GetRecordedList response, cached
+
+	# titleRegEx is a compiled regular expression (or None), recGroup and storageGroup strings (or
+	# None) - like the backend, only the programs matching all of them are listed:
+	def RecordedList(self, startIndex, count, descending, titleRegEx = None, recGroup = None, storageGroup = None):
+		filtered = not (titleRegEx is None and recGroup is None and storageGroup is None)
+		self.lock.acquire()
+		try:
+			if startIndex == 0 and count is None and not descending and not filtered:
+				if self.fullList is None:
+					self.fullList = synthetic_library.RecordedListXml(self.programs)
+				return self.fullList
+
+			programs = self.programs
+			if filtered:
+				programs = [program for program in programs
+					if (titleRegEx is None or titleRegEx.search(program['Title'])) and
+						(recGroup is None or program['RecGroup'] == recGroup) and
+						(storageGroup is None or program['StorageGroup'] == storageGroup)]
+			return synthetic_library.RecordedListXml(programs, startIndex, count, descending)
+		finally:
+			self.lock.release()
+
+	def Lookup(self, chanId, startTs):
+		return self.byId.get((chanId, startTs))
+
+	def LookupFile(self, storageGroup, fileName):
+		self.lock.acquire()
+		try:
+			for program in self.programs:
+				if program['FileName'] == fileName and program['StorageGroup'] == storageGroup:
+					return program
+			return None
+		finally:
+			self.lock.release()
+
+	# Adds count new recordings - the last one finished a minute ago, the others an hour apart
+	# before that:
+	def Add(self, count):
+		newPrograms = synthetic_library.MakePrograms(count, self.nextSeed, 0)
+		self.nextSeed = self.nextSeed + 1
+
+		now = datetime.datetime.utcnow().replace(microsecond = 0)
+		for i, program in enumerate(newPrograms):
+			start = now - datetime.timedelta(minutes = 60 * (count - i) - 29)
+			end = start + datetime.timedelta(minutes = 30)
+			program['StartTime'] = program['StartTs'] = start.strftime(synthetic_library.TIMESTAMP_FORMAT)
+			program['EndTime'] = program['EndTs'] = end.strftime(synthetic_library.TIMESTAMP_FORMAT)
+			program['FileName'] = u'%s_%s.ts' % (program['ChanId'], start.strftime('%Y%m%d%H%M%S'))
+
+		self.lock.acquire()
+		try:
+			# Keep the list in order of start time:
+			for program in newPrograms:
+				startTimes = [existing['StartTs'] for existing in self.programs]
+				self.programs.insert(bisect.bisect_right(startTimes, program['StartTs']), program)
+				self.byId[(program['ChanId'], program['StartTs'])] = program
+			self.fullList = None
+		finally:
+			self.lock.release()
+		return newPrograms
+
+	def Delete(self, chanId, startTs):
+		self.lock.acquire()
+		try:
+			program = self.byId.pop((chanId, startTs), None)
+			if program is None:
+				return None
+			self.programs.remove(program)
+			self.fullList = None
+			return program
+		finally:
+			self.lock.release()
+
+	def Update(self, chanId, startTs, recGroup):
+		self.lock.acquire()
+		try:
+			program = self.byId.get((chanId, startTs))
+			if program is None:
+				return None
+			program['RecGroup'] = recGroup
+			self.fullList = None
+			return program
+		finally:
+			self.lock.release()
+
+####################################################################################################
+# Events:
+# =======
+# The backend protocol, as far as monitors are concerned: the MYTH_PROTO_VERSION handshake, then
+# "ANN Monitor <host> 1" - after which the events are sent as BACKEND_MESSAGE messages.
+#
+# Messages are the length (8 characters, space padded) followed by the fields, separated by
+# "[]:[]".
+####################################################################################################
+
+PROTOCOL_SEPARATOR = u"[]:[]"
+PROTOCOL_VERSION = 77
+PROTOCOL_TOKEN = "WindMark"
+
+def SendMessage(connection, fields):
+	data = PROTOCOL_SEPARATOR.join(fields).encode('utf-8')
+	connection.sendall("%-8d%s" % (len(data), data))
+
+def ReadMessage(connection):
+	length = int(ReadExactly(connection, 8).strip())
+	return ReadExactly(connection, length).decode('utf-8').split(PROTOCOL_SEPARATOR)
+
+def ReadExactly(connection, size):
+	chunks = []
+	while size > 0:
+		chunk = connection.recv(size)
+		if not chunk:
+			raise socket.error("connection closed")
+		chunks.append(chunk)
+		size = size - len(chunk)
+	return "".join(chunks)
+
+class EventRequestHandler(SocketServer.BaseRequestHandler):
+	def handle(self):
+		try:
+			# MYTH_PROTO_VERSION <version> <token>:
+			words = ReadMessage(self.request)[0].split()
+			if len(words) != 3 or words[0] != 'MYTH_PROTO_VERSION' or words[1:] != [str(PROTOCOL_VERSION), PROTOCOL_TOKEN]:
+				SendMessage(self.request, [u'REJECT', unicode(PROTOCOL_VERSION)])
+				return
+			SendMessage(self.request, [u'ACCEPT', unicode(PROTOCOL_VERSION)])
+
+			words = ReadMessage(self.request)[0].split()
+			if len(words) < 4 or words[:2] != ['ANN', 'Monitor'] or words[3] != '1':
+				SendMessage(self.request, [u'ERROR', u'only event monitors are supported'])
+				return
+			SendMessage(self.request, [u'OK'])
+			self.server.AddMonitor(self.request)
+
+			# Wait for the monitor to hang up (DONE, or closing the connection):
+			while ReadMessage(self.request)[0] != 'DONE':
+				pass
+		except (socket.error, ValueError):
+			pass
+		finally:
+			self.server.RemoveMonitor(self.request)
+
+class EventServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, verbose = False):
+		SocketServer.TCPServer.__init__(self, address, EventRequestHandler)
+		self.verbose = verbose
+		self.lock = threading.Lock()
+		self.monitors = []
+
+	def AddMonitor(self, connection):
+		self.lock.acquire()
+		try:
+			self.monitors.append(connection)
+		finally:
+			self.lock.release()
+
+	def RemoveMonitor(self, connection):
+		self.lock.acquire()
+		try:
+			if connection in self.monitors:
+				self.monitors.remove(connection)
+		finally:
+			self.lock.release()
+
+	# Sends BACKEND_MESSAGE[]:[]<message>[]:[]<extra fields, or "empty"> to all monitors:
+	def Broadcast(self, message, extra = None):
+		if self.verbose:
+			sys.stderr.write("Event: %s\n" % message)
+		fields = [u'BACKEND_MESSAGE', message] + (extra or [u'empty'])
+		self.lock.acquire()
+		try:
+			for connection in list(self.monitors):
+				try:
+					SendMessage(connection, fields)
+				except socket.error:
+					self.monitors.remove(connection)
+		finally:
+			self.lock.release()
+
+	def Monitors(self):
+		self.lock.acquire()
+		try:
+			return len(self.monitors)
+		finally:
+			self.lock.release()
+
+# The backend protocol has its own timestamp format (no trailing Z):
+def EventTimestamp(startTs):
+	return startTs.rstrip('Z')
+
+# The program fields of an UPDATE event - only the ones the plug-in looks at are filled in, but
+# the file name is where the backend puts it (a myth:// URL):
+def EventProgramFields(program):
+	return [program['Title'], program['SubTitle'] or u'', program['Description'], u'0', u'0', u'0',
+		program['Category'], program['ChanId'], program['ChanId'][-2:], program['ChannelName'],
+		program['ChannelName'], u'myth://%s@mythbackend/%s' % (program['StorageGroup'], program['FileName']),
+		program['FileSize'], EventTimestamp(program['StartTime']), EventTimestamp(program['EndTime'])]
+
+####################################################################################################
+# The server:
+####################################################################################################
+
+class StandinRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+	def do_GET(self):
+		url = urlparse.urlparse(self.path)
+		query = dict(urlparse.parse_qsl(url.query, keep_blank_values = True))
+		endpoint = url.path.strip('/')
+		self.server.Count(endpoint)
+
+		if endpoint.startswith('Standin/'):
+			return self.Control(endpoint, query)
+
+		handler = ENDPOINTS.get(endpoint)
+		if handler is None:
+			return self.Reply(404, 'text/plain', 'Unknown endpoint: %s' % endpoint)
+
+		faults = self.server.faults
+		if faults.AppliesTo(endpoint):
+			delay = faults.latency
+			if faults.jitter:
+				delay = max(0.0, delay + random.uniform(-faults.jitter, faults.jitter))
+			if delay:
+				time.sleep(delay)
+			if faults.errorRate and random.random() < faults.errorRate:
+				return self.Reply(faults.errorStatus, 'text/plain', 'Injected error')
+
+		handler(self, query)
+
+	def Reply(self, status, contentType, body, headers = None):
+		self.send_response(status)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.WriteBody(body)
+
+	# Writes the body - subject to the bandwidth/slow-drip/drop faults:
+	def WriteBody(self, body):
+		faults = self.server.faults
+		endpoint = urlparse.urlparse(self.path).path.strip('/')
+		if not faults.AppliesTo(endpoint) or endpoint.startswith('Standin/'):
+			self.wfile.write(body)
+			return
+
+		dropAt = None
+		if faults.dropRate and random.random() < faults.dropRate:
+			dropAt = len(body) // 2
+
+		chunkSize = faults.dripSize or WRITE_CHUNK_SIZE
+		position = 0
+		while position < len(body):
+			if not dropAt is None and position >= dropAt:
+				self.close_connection = 1
+				self.connection.shutdown(2)
+				return
+			chunk = body[position:position + chunkSize]
+			self.wfile.write(chunk)
+			position = position + len(chunk)
+
+			delay = faults.dripDelay
+			if faults.bandwidth:
+				delay = delay + float(len(chunk)) / faults.bandwidth
+			if delay and position < len(body):
+				time.sleep(delay)
+
+	def Control(self, endpoint, query):
+		if endpoint == 'Standin/Faults':
+			try:
+				for name, value in query.items():
+					self.server.faults.Set(name, value)
+			except ValueError, e:
+				return self.Reply(400, 'text/plain', str(e))
+			return self.Reply(200, 'application/json', json.dumps(self.server.faults.AsDict()))
+		elif endpoint == 'Standin/Stats':
+			return self.Reply(200, 'application/json', json.dumps(self.server.Stats()))
+		elif endpoint == 'Standin/AddRecordings':
+			programs = self.server.library.Add(int(query.get('Count', 1)))
+			for program in programs:
+				self.server.Event(u'RECORDING_LIST_CHANGE ADD %s %s' % (program['ChanId'], EventTimestamp(program['StartTs'])))
+			return self.Reply(200, 'application/json', json.dumps([[p['ChanId'], p['StartTs']] for p in programs]))
+		elif endpoint == 'Standin/DeleteRecording':
+			program = self.server.library.Delete(query.get('ChanId'), query.get('StartTime'))
+			if program is None:
+				return self.Reply(404, 'text/plain', 'No such recording')
+			self.server.Event(u'RECORDING_LIST_CHANGE DELETE %s %s' % (program['ChanId'], EventTimestamp(program['StartTs'])))
+			return self.Reply(200, 'application/json', json.dumps([program['ChanId'], program['StartTs']]))
+		elif endpoint == 'Standin/UpdateRecording':
+			program = self.server.library.Update(query.get('ChanId'), query.get('StartTime'), query.get('RecGroup', u'Default'))
+			if program is None:
+				return self.Reply(404, 'text/plain', 'No such recording')
+			self.server.Event(u'RECORDING_LIST_CHANGE UPDATE', EventProgramFields(program))
+			return self.Reply(200, 'application/json', json.dumps([program['ChanId'], program['StartTs']]))
+		elif endpoint == 'Standin/Event':
+			self.server.Event(query.get('Message', u'RECORDING_LIST_CHANGE'))
+			return self.Reply(200, 'text/plain', 'OK')
+		return self.Reply(404, 'text/plain', 'Unknown endpoint: %s' % endpoint)
+
+def GetRecordedList(handler, query):
+	try:
+		startIndex = int(query.get('StartIndex', 0))
+		count = None
+		if 'Count' in query:
+			count = int(query['Count'])
+	except ValueError:
+		return handler.Reply(400, 'text/plain', 'Bad StartIndex/Count')
+	descending = query.get('Descending', '').lower() == 'true'
+
+	titleRegEx = None
+	if query.get('TitleRegEx'):
+		try:
+			titleRegEx = re.compile(query['TitleRegEx'].decode('utf-8'), re.IGNORECASE | re.UNICODE)
+		except re.error:
+			return handler.Reply(400, 'text/plain', 'Bad TitleRegEx')
+	recGroup = query.get('RecGroup') or None
+	storageGroup = query.get('StorageGroup') or None
+	if not recGroup is None:
+		recGroup = recGroup.decode('utf-8')
+	if not storageGroup is None:
+		storageGroup = storageGroup.decode('utf-8')
+
+	handler.Reply(200, 'application/xml',
+		handler.server.library.RecordedList(startIndex, count, descending, titleRegEx, recGroup, storageGroup))
+
+def GetRecorded(handler, query):
+	program = handler.server.library.Lookup(query.get('ChanId'), query.get('StartTime'))
+	if program is None:
+		return handler.Reply(404, 'text/plain', 'No such recording')
+	handler.Reply(200, 'application/xml', synthetic_library.RecordedXml(program))
+
+def GetPreviewImage(handler, query):
+	program = handler.server.library.Lookup(query.get('ChanId'), query.get('StartTime'))
+	if program is None:
+		return handler.Reply(404, 'text/plain', 'No such recording')
+	handler.Reply(200, 'image/png', MakeImage(query))
+
+def GetRecordingArtwork(handler, query):
+	if not query.get('Inetref'):
+		return handler.Reply(404, 'text/plain', 'No artwork')
+	handler.Reply(200, 'image/jpeg', MakeImage(query))
+
+def GetRecording(handler, query):
+	program = handler.server.library.Lookup(query.get('ChanId'), query.get('StartTime'))
+	if program is None:
+		return handler.Reply(404, 'text/plain', 'No such recording')
+	location = '/Content/GetFile?' + urllib.urlencode({
+		'StorageGroup': program['StorageGroup'].encode('utf-8'),
+		'FileName': program['FileName'].encode('utf-8')
+	})
+	handler.Reply(302, 'text/plain', '', {'Location': location})
+
+def GetFile(handler, query):
+	program = handler.server.library.LookupFile(query.get('StorageGroup', 'Default'), query.get('FileName'))
+	if program is None:
+		return handler.Reply(404, 'text/plain', 'No such file')
+
+	size = handler.server.fileSize
+	first, last = 0, size - 1
+	rangeHeader = handler.headers.get('Range')
+	if rangeHeader and rangeHeader.startswith('bytes='):
+		start, end = rangeHeader[len('bytes='):].split(',')[0].split('-')
+		if start:
+			first = int(start)
+			if end:
+				last = min(int(end), size - 1)
+		else:
+			first = max(0, size - int(end))
+		if first > last:
+			return handler.Reply(416, 'text/plain', '', {'Content-Range': 'bytes */%d' % size})
+
+	body = MakeFileData(first, last - first + 1)
+	if rangeHeader:
+		handler.Reply(206, 'video/mp2t', body, {'Content-Range': 'bytes %d-%d/%d' % (first, last, size), 'Accept-Ranges': 'bytes'})
+	else:
+		handler.Reply(200, 'video/mp2t', body, {'Accept-Ranges': 'bytes'})
+
+# Image data of a plausible size for the requested dimensions:
+def MakeImage(query):
+	width = int(query.get('Width') or 640)
+	height = int(query.get('Height') or width * 9 // 16)
+	return '\xff\xd8\xff\xe0' + '\0' * max(1024, width * height // 8) + '\xff\xd9'
+
+# Transport stream packets (188 bytes, starting with the 0x47 sync byte):
+def MakeFileData(offset, length):
+	packet = '\x47' + '\xff' * 187
+	start = offset % len(packet)
+	packets = (start + length) // len(packet) + 1
+	return (packet * packets)[start:start + length]
+
+ENDPOINTS = {
+	'Dvr/GetRecordedList': GetRecordedList,
+	'Dvr/GetRecorded': GetRecorded,
+	'Content/GetPreviewImage': GetPreviewImage,
+	'Content/GetRecordingArtwork': GetRecordingArtwork,
+	'Content/GetRecording': GetRecording,
+	'Content/GetFile': GetFile,
+}
+
+class StandinServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, library, faults = None, fileSize = DEFAULT_FILE_SIZE, verbose = False):
+		BaseHTTPServer.HTTPServer.__init__(self, address, StandinRequestHandler)
+		self.library = library
+		self.faults = faults or Faults()
+		self.fileSize = fileSize
+		self.verbose = verbose
+		self.statsLock = threading.Lock()
+		self.requests = {}
+		self.events = None		# the EventServer, if any
+
+	def Event(self, message, extra = None):
+		if not self.events is None:
+			self.events.Broadcast(message, extra)
+
+	def Count(self, endpoint):
+		self.statsLock.acquire()
+		try:
+			self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+		finally:
+			self.statsLock.release()
+
+	def Stats(self):
+		self.statsLock.acquire()
+		try:
+			return {'requests': dict(self.requests), 'recordings': len(self.library.programs)}
+		finally:
+			self.statsLock.release()
+
+	def Url(self):
+		host, port = self.server_address
+		return 'http://%s:%d/' % (host, port)
+
+def ServeInBackground(server):
+	thread = threading.Thread(target = server.serve_forever)
+	thread.daemon = True
+	thread.start()
+
+# Starts a stand-in serving a library of size recordings in a background thread (port 0: any
+# free port - see server.server_address). With eventPort (0: any free port), it sends events
+# too - see server.events.server_address:
+def StartStandin(size, port = 0, host = '127.0.0.1', faults = None, eventPort = None, **kwargs):
+	server = StandinServer((host, port), Library(size), faults, **kwargs)
+	if not eventPort is None:
+		server.events = EventServer((host, eventPort), server.verbose)
+		ServeInBackground(server.events)
+	ServeInBackground(server)
+	return server
+
+def Main():
+	parser = optparse.OptionParser(usage = "%prog [options]")
+	parser.add_option('--host', default = '127.0.0.1', help = "address to listen on (default: %default)")
+	parser.add_option('--port', type = 'int', default = 6544, help = "port to listen on (default: %default)")
+	parser.add_option('--size', type = 'int', default = 1000, help = "number of recordings (default: %default)")
+	parser.add_option('--seed', type = 'int', default = 1, help = "random seed of the library (default: %default)")
+	parser.add_option('--in-progress', type = 'int', default = 2, help = "recordings still in progress (default: %default)")
+	parser.add_option('--file-size', type = 'int', default = DEFAULT_FILE_SIZE, help = "size of the recording files (default: %default)")
+	parser.add_option('--latency', help = "seconds to wait before responding")
+	parser.add_option('--jitter', help = "random variation of the latency (seconds)")
+	parser.add_option('--bandwidth', help = "max. bytes per second")
+	parser.add_option('--drip-size', dest = 'dripSize', help = "send the responses this many bytes at a time...")
+	parser.add_option('--drip-delay', dest = 'dripDelay', help = "...waiting this many seconds in between")
+	parser.add_option('--error-rate', dest = 'errorRate', help = "fraction of the requests to fail")
+	parser.add_option('--error-status', dest = 'errorStatus', help = "HTTP status of the failed requests")
+	parser.add_option('--drop-rate', dest = 'dropRate', help = "fraction of the responses to cut off")
+	parser.add_option('--endpoints', help = "comma-separated endpoints to inject faults into (default: all)")
+	parser.add_option('--event-port', dest = 'eventPort', type = 'int', help = "port to send events on (default: none)")
+	parser.add_option('--verbose', action = 'store_true', help = "log the requests")
+	options, args = parser.parse_args()
+
+	faults = Faults()
+	for name in faults.AsDict().keys():
+		value = getattr(options, name, None)
+		if not value is None:
+			faults.Set(name, value)
+
+	sys.stderr.write("Generating a library of %d recordings...\n" % options.size)
+	library = Library(options.size, options.seed, options.in_progress)
+	server = StandinServer((options.host, options.port), library, faults, options.file_size, options.verbose)
+	if not options.eventPort is None:
+		server.events = EventServer((options.host, options.eventPort), options.verbose)
+		ServeInBackground(server.events)
+		sys.stderr.write("Sending events on port %d\n" % options.eventPort)
+	sys.stderr.write("Serving on %s\n" % server.Url())
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	Main()
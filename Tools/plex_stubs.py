@@ -0,0 +1,249 @@
+# MythRecordings plug-in for Plex
+# Copyright (C) 2013 Thomas Schaumburg
+#
+# Minimal stand-ins for the Plex plug-in framework (Prefs, Data, HTTP, Resource,
+# ObjectContainer and friends), so the plug-in code can be loaded and its routes called
+# outside Plex Media Server - see benchmark.py.
+#
+# Only what the plug-in uses is implemented, and only as far as it's needed to exercise
+# the code: objects just remember their attributes, and Callback just remembers the function
+# and arguments (call it with Invoke).
+
+import atexit
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+
+# Plex runs plug-ins with utf-8 as the default encoding:
+reload(sys)
+sys.setdefaultencoding('utf-8')
+
+BUNDLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Contents')
+
+####################################################################################################
+# Framework objects:
+####################################################################################################
+
+class PrefsStub(dict):
+	def __getitem__(self, key):
+		return self.get(key)
+
+def LoadDefaultPrefs():
+	prefs = PrefsStub()
+	for pref in json.load(open(os.path.join(BUNDLE_PATH, 'DefaultPrefs.json'))):
+		value = pref.get('default')
+		if pref.get('type') == 'bool':
+			value = (value == 'true')
+		prefs[pref['id']] = value
+	return prefs
+
+# The Plex data store - kept in memory (pickled, like the real one), so a "restarted"
+# plug-in can be handed the data store of the previous one:
+class DataStub(object):
+	def __init__(self):
+		self.objects = {}
+		self.files = {}
+
+	def LoadObject(self, key):
+		if not key in self.objects:
+			return None
+		return pickle.loads(self.objects[key])
+
+	def SaveObject(self, key, value):
+		self.objects[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+	def Load(self, key, binary = False):
+		return self.files.get(key)
+
+	def Save(self, key, value, binary = False):
+		self.files[key] = value
+
+	def Exists(self, key):
+		return key in self.files or key in self.objects
+
+	def Remove(self, key):
+		self.files.pop(key, None)
+		self.objects.pop(key, None)
+
+	def Size(self):
+		return sum(len(value) for value in self.objects.values()) + sum(len(value) for value in self.files.values())
+
+class HTTPResponseStub(object):
+	def __init__(self, content):
+		self.content = content
+
+class HTTPStub(object):
+	def Request(self, url, cacheTime = None, headers = None, **kwargs):
+		import urllib2
+		return HTTPResponseStub(urllib2.urlopen(urllib2.Request(url, headers = headers or {})).read())
+
+class ResourceStub(object):
+	def Load(self, name, binary = False):
+		return open(os.path.join(BUNDLE_PATH, 'Resources', name), 'rb').read()
+
+	def ContentsOfURLWithFallback(self, url, fallback = None):
+		return ('ContentsOfURLWithFallback', url, fallback)
+
+# Timers are cancelled when Python exits (see CancelTimers) - a daemon timer firing while the
+# interpreter is shutting down would find the plug-in's globals gone:
+class ThreadStub(object):
+	def __init__(self):
+		self.timers = []
+		atexit.register(self.CancelTimers)
+
+	def Create(self, function, globalize = True, *args, **kwargs):
+		thread = threading.Thread(target = function, args = args, kwargs = kwargs)
+		thread.daemon = True
+		thread.start()
+		return thread
+
+	def CreateTimer(self, interval, function, globalize = True, *args, **kwargs):
+		timer = threading.Timer(interval, function, args, kwargs)
+		timer.daemon = True
+		timer.start()
+		self.timers = [other for other in self.timers if other.is_alive()] + [timer]
+		return timer
+
+	# Cancels the pending timers - and waits for the ones already running:
+	def CancelTimers(self):
+		for timer in self.timers:
+			timer.cancel()
+		for timer in self.timers:
+			timer.join()
+
+	def Lock(self, key = None):
+		return threading.Lock()
+
+	def RLock(self, key = None):
+		return threading.RLock()
+
+	def Event(self, key = None):
+		return threading.Event()
+
+	def Semaphore(self, key = None, limit = 1):
+		return threading.Semaphore(limit)
+
+	def Sleep(self, seconds):
+		time.sleep(seconds)
+
+class FrameworkObject(object):
+	def __init__(self, **kwargs):
+		self.__dict__.update(kwargs)
+
+class ObjectContainer(FrameworkObject):
+	def __init__(self, objects = None, **kwargs):
+		FrameworkObject.__init__(self, **kwargs)
+		self.objects = list(objects or [])
+
+	def add(self, obj):
+		self.objects.append(obj)
+
+	def __len__(self):
+		return len(self.objects)
+
+class DirectoryObject(FrameworkObject): pass
+class NextPageObject(FrameworkObject): pass
+class InputDirectoryObject(FrameworkObject): pass
+class PrefsObject(FrameworkObject): pass
+class VideoClipObject(FrameworkObject): pass
+class MediaObject(FrameworkObject): pass
+class PartObject(FrameworkObject): pass
+
+class MessageContainer(FrameworkObject):
+	def __init__(self, header, message):
+		FrameworkObject.__init__(self, header = header, message = message)
+
+class DataObject(FrameworkObject):
+	def __init__(self, data, mime_type = None):
+		FrameworkObject.__init__(self, data = data, mime_type = mime_type)
+
+class Redirect(FrameworkObject):
+	def __init__(self, url):
+		FrameworkObject.__init__(self, url = url)
+
+# The HTTP response of the route being called:
+class ResponseStub(object):
+	def __init__(self):
+		self.Status = 200
+		self.Headers = {}
+
+class Callback(FrameworkObject):
+	def __init__(self, function, **kwargs):
+		FrameworkObject.__init__(self, function = function, kwargs = kwargs)
+
+	def Invoke(self):
+		return self.function(**self.kwargs)
+
+class LogStub(object):
+	def __init__(self, verbose = False):
+		self.verbose = verbose
+		self.count = 0
+
+	def __call__(self, message, *args):
+		self.count = self.count + 1
+		if self.verbose:
+			if args:
+				message = message % args
+			sys.stderr.write("LOG: %s\n" % message)
+
+	Debug = Info = Warn = Error = Exception = Critical = __call__
+
+####################################################################################################
+# LoadPlugin:
+# ===========
+# Loads (a fresh copy of) the plug-in code with the stubbed framework.
+#
+# Parameters:
+# -----------
+#    prefs:   {pref id : value} overriding DefaultPrefs.json
+#    data:    a DataStub to start with (to simulate a restart), or None for an empty one
+#    start:   whether to call Start() - as Plex does when loading the plug-in
+#
+# Return:
+#    the plug-in's global namespace (so plugin['MainMenu']() calls the MainMenu route)
+####################################################################################################
+def LoadPlugin(prefs = None, data = None, start = True, verbose = False):
+	strings = json.load(open(os.path.join(BUNDLE_PATH, 'Strings', 'en.json')))
+
+	defaultPrefs = LoadDefaultPrefs()
+	if prefs:
+		defaultPrefs.update(prefs)
+
+	plugin = {
+		'__name__': 'MythRecordings',
+		'Prefs': defaultPrefs,
+		'Data': data or DataStub(),
+		'HTTP': HTTPStub(),
+		'Resource': ResourceStub(),
+		'Response': ResponseStub(),
+		'Thread': ThreadStub(),
+		'Log': LogStub(verbose),
+		'R': lambda name: 'resource://' + str(name),
+		'L': lambda key: strings.get(key, key),
+		'F': lambda key, *args: strings.get(key, key) % args,
+		'handler': lambda *args, **kwargs: (lambda function: function),
+		'route': lambda *args, **kwargs: (lambda function: function),
+		'ObjectContainer': ObjectContainer,
+		'DirectoryObject': DirectoryObject,
+		'NextPageObject': NextPageObject,
+		'InputDirectoryObject': InputDirectoryObject,
+		'PrefsObject': PrefsObject,
+		'VideoClipObject': VideoClipObject,
+		'MediaObject': MediaObject,
+		'PartObject': PartObject,
+		'MessageContainer': MessageContainer,
+		'DataObject': DataObject,
+		'Redirect': Redirect,
+		'Callback': Callback,
+	}
+
+	codePath = os.path.join(BUNDLE_PATH, 'Code', '__init__.py')
+	code = compile(open(codePath).read(), codePath, 'exec')
+	exec code in plugin
+
+	if start:
+		plugin['Start']()
+	return plugin
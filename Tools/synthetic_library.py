@@ -0,0 +1,208 @@
+# MythRecordings plug-in for Plex
+# Copyright (C) 2013 Thomas Schaumburg
+#
+# Synthetic MythTV recording libraries, for benchmarking and load testing the plug-in without
+# a MythTV backend.
+#
+# The libraries are meant to look like a real one: series with many episodes (some with the
+# episode name mangled into the title, the way some EPG providers do it), one-off programs,
+# the category spellings that CategoryAliases.json conflates, recordings that the plug-in
+# hides (deleted, LiveTV, empty files) - and a few recordings still in progress.
+#
+# The same size and seed always give the same library (apart from the in-progress
+# recordings, which are placed relative to the current time).
+
+import datetime
+import random
+from xml.sax.saxutils import escape
+
+SERIES = [
+	u'Sherlock Holmes', u'CSI: New York', u'The Tonight Show', u'Tonight Show', u'Doctor Who',
+	u'Bl\xe5 Bog', u'Nyheder', u'Match of the Day', u'Forbrydelsen', u'Borgen',
+	u'QI', u'Top Gear', u'Mad Men', u'Breaking Bad', u'The Wire', u'Downton Abbey',
+	u'Who?', u'Deadline', u'Horizon', u'Natur\xe5ret'
+]
+
+EPISODE_WORDS = [
+	u'Scandal', u'Hounds', u'Return', u'Secret', u'Night', u'River', u'Fire', u'Last', u'Crown',
+	u'Winter', u'Game', u'Light', u'Storm', u'Shadow', u'Glass', u'North', u'Blood', u'Silver'
+]
+
+CATEGORIES = [
+	u'Series', u'series', u'serie', u'kids', u'Children', u'documentary', u'educational',
+	u'Entertainment', u'film', u'Movie', u'drama', u'Sport', u'fodbold', u'', u'Nyheder',
+	u'Ukategoriseret'
+]
+
+CHANNELS = [
+	(u'1001', u'DR1'), (u'1002', u'DR2'), (u'1003', u'TV 2'), (u'1004', u'TV3'),
+	(u'1005', u'BBC One'), (u'1006', u'BBC Two'), (u'1007', u'Kanal 5'), (u'1008', u'DR K'),
+	(u'1009', u'TV 2 News'), (u'0', u'Unknown')
+]
+
+RECORDING_GROUPS = [u'Default'] * 12 + [u'Kids', u'Sport', u'Deleted', u'LiveTV']
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+####################################################################################################
+# MakePrograms:
+# =============
+# Makes a library of count recordings, oldest first (the order of Dvr/GetRecordedList).
+#
+# Return:
+#    list of {field name : value} dictionaries - see ProgramXml for the field names
+####################################################################################################
+def MakePrograms(count, seed = 1, inProgress = 2):
+	rnd = random.Random(seed)
+	programs = []
+	start = datetime.datetime(2012, 1, 1, 6, 0, 0)
+	now = datetime.datetime.utcnow().replace(microsecond = 0)
+
+	for i in range(count):
+		start = start + datetime.timedelta(minutes = rnd.choice([30, 45, 60, 90, 120, 180]))
+		length = datetime.timedelta(minutes = rnd.choice([25, 30, 45, 55, 60, 90, 120]))
+
+		chanId, channelName = rnd.choice(CHANNELS)
+		episodeName = u'%s %s' % (rnd.choice(EPISODE_WORDS), rnd.choice(EPISODE_WORDS))
+		if rnd.random() < 0.8:
+			title = rnd.choice(SERIES)
+			subTitle = episodeName
+			inetref = u'ttvdb.py_%d' % (SERIES.index(title) + 70000)
+			mangling = rnd.random()
+			if mangling < 0.15:
+				# Mangled: the episode name is in the title:
+				title = u'%s: %s' % (title, episodeName)
+				subTitle = None
+			elif mangling < 0.25:
+				title = u'%s - %s' % (title, episodeName)
+		else:
+			# One-off program:
+			title = u'%s %s %d' % (rnd.choice(EPISODE_WORDS), rnd.choice(EPISODE_WORDS), i)
+			subTitle = None
+			inetref = None
+		if rnd.random() < 0.005:
+			title = u'Unknown'
+
+		programStart = start
+		programEnd = start + length
+		recordingStart = programStart + datetime.timedelta(seconds = rnd.choice([-60, 0, 0, 0, 30, 120]))
+		recordingEnd = programEnd + datetime.timedelta(seconds = rnd.choice([-120, 0, 0, 60, 300]))
+		if i >= count - inProgress:
+			# Still recording:
+			programStart = now - datetime.timedelta(minutes = 10 + i % 20, seconds = i % 60)
+			programEnd = programStart + length
+			recordingStart = programStart
+			recordingEnd = now + datetime.timedelta(minutes = 20)
+
+		programs.append({
+			'Title': title,
+			'SubTitle': subTitle,
+			'Category': rnd.choice(CATEGORIES),
+			'Description': u'Synthetic program %d. %s' % (i, u' '.join(rnd.choice(EPISODE_WORDS) for w in range(rnd.randint(5, 40)))),
+			'Inetref': inetref,
+			'FileName': u'%s_%s.ts' % (chanId, recordingStart.strftime('%Y%m%d%H%M%S')),
+			'FileSize': (u'0' if rnd.random() < 0.01 else unicode(rnd.randint(100000000, 6000000000))),
+			'StartTime': programStart.strftime(TIMESTAMP_FORMAT),
+			'EndTime': programEnd.strftime(TIMESTAMP_FORMAT),
+			'ChanId': chanId,
+			'ChannelName': channelName,
+			'RecGroup': rnd.choice(RECORDING_GROUPS),
+			'StorageGroup': u'Default',
+			'StartTs': recordingStart.strftime(TIMESTAMP_FORMAT),
+			'EndTs': recordingEnd.strftime(TIMESTAMP_FORMAT),
+		})
+
+	return programs
+
+def Element(tag, value):
+	if value is None:
+		return u'<%s/>' % tag
+	return u'<%s>%s</%s>' % (tag, escape(value), tag)
+
+# Returns the Program element of a program, as returned by Dvr/GetRecorded(List):
+def ProgramXml(program):
+	return u''.join([
+		u'<Program>',
+		Element('StartTime', program['StartTime']),
+		Element('EndTime', program['EndTime']),
+		Element('Title', program['Title']),
+		Element('SubTitle', program['SubTitle']),
+		Element('Category', program['Category']),
+		Element('CatType', u'series'),
+		Element('Repeat', u'false'),
+		Element('VideoProps', u'0'),
+		Element('AudioProps', u'0'),
+		Element('SubProps', u'0'),
+		Element('SeriesId', u''),
+		Element('ProgramId', u''),
+		Element('Stars', u'0'),
+		Element('FileSize', program['FileSize']),
+		Element('LastModified', program['EndTs']),
+		Element('ProgramFlags', u'0'),
+		Element('FileName', program['FileName']),
+		Element('HostName', u'mythbackend'),
+		Element('Airdate', program['StartTime'][:10]),
+		Element('Description', program['Description']),
+		Element('Inetref', program['Inetref']),
+		Element('Season', u'0'),
+		Element('Episode', u'0'),
+		u'<Channel>',
+		Element('ChanId', program['ChanId']),
+		Element('ChanNum', program['ChanId'][-2:]),
+		Element('CallSign', program['ChannelName']),
+		Element('IconURL', u''),
+		Element('ChannelName', program['ChannelName']),
+		u'</Channel>',
+		u'<Recording>',
+		Element('Status', u'-3'),
+		Element('Priority', u'0'),
+		Element('StartTs', program['StartTs']),
+		Element('EndTs', program['EndTs']),
+		Element('RecordId', u'1'),
+		Element('RecGroup', program['RecGroup']),
+		Element('PlayGroup', u'Default'),
+		Element('StorageGroup', program['StorageGroup']),
+		Element('RecType', u'0'),
+		Element('DupInType', u'15'),
+		Element('DupMethod', u'6'),
+		Element('EncoderId', u'1'),
+		Element('Profile', u'Default'),
+		u'</Recording>',
+		u'<Artwork><ArtworkInfos/></Artwork>',
+		u'</Program>'
+	])
+
+# Returns the Dvr/GetRecordedList response for (a page of) programs:
+def RecordedListXml(programs, startIndex = 0, count = None, descending = False):
+	total = len(programs)
+	if descending:
+		programs = programs[::-1]
+	if count is None:
+		count = total
+	page = programs[startIndex:startIndex + count]
+
+	return u''.join([
+		u'<?xml version="1.0" encoding="UTF-8"?>',
+		u'<ProgramList xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" version="1.0" serializerVersion="1.1">',
+		u'<StartIndex>%d</StartIndex>' % startIndex,
+		u'<Count>%d</Count>' % len(page),
+		u'<TotalAvailable>%d</TotalAvailable>' % total,
+		u'<AsOf>%s</AsOf>' % datetime.datetime.utcnow().strftime(TIMESTAMP_FORMAT),
+		u'<Version>0.27.20140520-1</Version>',
+		u'<ProtoVer>77</ProtoVer>',
+		u'<Programs>',
+		u''.join(ProgramXml(program) for program in page),
+		u'</Programs>',
+		u'</ProgramList>'
+	]).encode('utf-8')
+
+# Returns the Dvr/GetRecorded response for a program:
+def RecordedXml(program):
+	return (u'<?xml version="1.0" encoding="UTF-8"?>' + ProgramXml(program)).encode('utf-8')
+
+if __name__ == '__main__':
+	import sys
+	count = 1000
+	if len(sys.argv) > 1:
+		count = int(sys.argv[1])
+	sys.stdout.write(RecordedListXml(MakePrograms(count)))